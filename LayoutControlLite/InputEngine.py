@@ -0,0 +1,98 @@
+from collections import deque
+from time import monotonic
+
+class InputEngine:
+    # Presses from push buttons, keys and the panel all come through here. A press
+    # that follows the last one for the same thing within debounce is contact bounce
+    # and is dropped. Otherwise presses are gathered for window seconds from the
+    # first one and then acted on once. Presses that toggle cancel out in pairs so an
+    # odd number is a single toggle and an even number does nothing, other presses
+    # all come to a single action. Times are from the monotonic clock so changes to
+    # the time of day make no difference
+    def __init__(self, debounce = 0.05, window = 0.15, history = 1000):
+        self.debounce = debounce
+        self.window = window
+        self.last_press = {}
+        # key -> [time of first press, number of presses, action, toggles], in the
+        # order of the first press, which is also the order that they fall due
+        self.pending = {}
+        # The time of the first press of the action being carried out, if any
+        self.acting = None
+        self.latencies = deque(maxlen = history)
+        self.presses = 0
+        self.bounces = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.actions = 0
+
+    def debounced(self, key, now = None):
+        # Returns False if the press was taken to be a bounce, for presses that are
+        # acted on straight away rather than coalesced
+        if now is None:
+            now = monotonic()
+        last = self.last_press.get(key)
+        if last is not None and now - last < self.debounce:
+            self.bounces += 1
+            return False
+        self.last_press[key] = now
+        self.presses += 1
+        return True
+
+    def press(self, key, action, now = None, toggles = True):
+        # Returns False if the press was taken to be a bounce
+        if now is None:
+            now = monotonic()
+        if not self.debounced(key, now):
+            return False
+        pending = self.pending.get(key)
+        if pending:
+            pending[1] += 1
+            self.coalesced += 1
+        else:
+            self.pending[key] = [now, 1, action, toggles]
+        return True
+
+    def timeout(self, now = None):
+        # Seconds until the next action is due, or None if nothing is waiting
+        if not self.pending:
+            return None
+        if now is None:
+            now = monotonic()
+        first = next(iter(self.pending.values()))[0]
+        return max(0.0, first + self.window - now)
+
+    def run_due(self, now = None):
+        # Carry out the actions whose window has closed, returns how many were done
+        if not self.pending:
+            return 0
+        if now is None:
+            now = monotonic()
+        done = 0
+        while self.pending:
+            key = next(iter(self.pending))
+            first, presses, action, toggles = self.pending[key]
+            if now - first < self.window:
+                break
+            del self.pending[key]
+            if presses % 2 or not toggles:
+                self.acting = first
+                try:
+                    action()
+                finally:
+                    self.acting = None
+                self.actions += 1
+                done += 1
+                self.latencies.append(now - first)
+            else:
+                self.cancelled += presses
+        return done
+
+    def stats(self):
+        latencies = list(self.latencies)
+        return {'presses': self.presses,
+                'bounces': self.bounces,
+                'coalesced': self.coalesced,
+                'cancelled': self.cancelled,
+                'actions': self.actions,
+                'mean_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+                'max_latency': max(latencies) if latencies else 0.0}
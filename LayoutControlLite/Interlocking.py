@@ -0,0 +1,84 @@
+class Interlocking:
+    # Stops routes that need the same items from being set at the same time. Every
+    # item a route claims is given a bit and each route has a mask of the items it
+    # claims, when a route is added its mask is compared with every other route
+    # once to make a row of the conflict matrix, itself a mask with a bit per route.
+    # Checking a request is then a single and of its row with the mask of locked
+    # routes however many routes and items there are
+    def __init__(self):
+        self.item_bits = {}
+        self.route_bits = {}
+        self.masks = []
+        self.conflicts = []
+        self.locked = 0
+        self.locked_items = 0
+
+    def claims(self, item, does):
+        # A signal or track put to danger protects a route rather than being part
+        # of it, so routes may share those
+        return does != 'danger'
+
+    def _item_bit(self, item):
+        if item not in self.item_bits:
+            self.item_bits[item] = 1 << len(self.item_bits)
+        return self.item_bits[item]
+
+    def add(self, route, legs):
+        # legs is a list of (item, position) with each item once, as in a RoutePlan
+        if route in self.route_bits:
+            raise ValueError(f'Route \'{route.id}\' has already been added to the interlocking')
+        mask = 0
+        for item, does in legs:
+            if self.claims(item, does):
+                mask |= self._item_bit(item)
+        ndx = len(self.masks)
+        bit = 1 << ndx
+        conflicts = 0
+        for other in range(ndx):
+            if self.masks[other] & mask:
+                conflicts |= 1 << other
+                self.conflicts[other] |= bit
+        self.masks.append(mask)
+        self.conflicts.append(conflicts)
+        self.route_bits[route] = ndx
+
+    def conflicts_with(self, route):
+        # The locked routes that stop route from being set
+        row = self.conflicts[self.route_bits[route]] & self.locked
+        return [other for other, ndx in self.route_bits.items() if row & (1 << ndx)]
+
+    def can_lock(self, route):
+        return not self.conflicts[self.route_bits[route]] & self.locked
+
+    def is_locked(self, route):
+        return bool(self.locked & (1 << self.route_bits[route]))
+
+    def lock(self, route):
+        # Returns True if the route is now locked, False if a conflicting route is
+        # already locked. Locking a route that is already locked is allowed
+        ndx = self.route_bits[route]
+        if self.conflicts[ndx] & self.locked:
+            return False
+        self.locked |= 1 << ndx
+        self.locked_items |= self.masks[ndx]
+        return True
+
+    def release(self, route):
+        # Returns False if the route was not locked, its items may then belong to
+        # a locked route so nothing is changed
+        ndx = self.route_bits[route]
+        if not self.locked & (1 << ndx):
+            return False
+        self.locked &= ~(1 << ndx)
+        # Routes that are locked together never share an item so the items of the
+        # released route can simply be taken out
+        self.locked_items &= ~self.masks[ndx]
+        return True
+
+    def release_all(self):
+        self.locked = 0
+        self.locked_items = 0
+
+    def item_locked(self, item):
+        bit = self.item_bits.get(item)
+        return bit is not None and bool(self.locked_items & bit)
@@ -1,7 +1,20 @@
-from datetime import timedelta, datetime as dt
-from getkey import getkey, keys
-import PySimpleGUI as sg
-import networkzero as nw0
+from time import sleep, monotonic
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import threading
+import selectors
+import socket
+import queue
+import os
+import sys
+import importlib
+from . import WireProtocol
+from .SpatialIndex import SpatialIndex
+from .Interlocking import Interlocking
+from .Topology import Topology
+from .InputEngine import InputEngine
+from . import Tracing
 try:
     from gpiozero import Button # pyright: ignore [reportMissingImports]
 except:
@@ -11,6 +24,23 @@ except:
             self.kwargs = kwargs
             print('Pseudo GPIOZERO button on pin', pin_id)
 
+class _LazyModule:
+    # Stands in for a module until something in it is first used, so a headless
+    # layout never loads Tk and a layout without supervisors never loads networkzero.
+    # On first use the real module takes its place in the globals of this module
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attribute):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attribute)
+
+sg = _LazyModule('PySimpleGUI', 'sg')
+nw0 = _LazyModule('networkzero', 'nw0')
+getkey = _LazyModule('getkey', 'getkey')
+
 TRACK_SAFE = 1
 TRACK_DANGER = 0
 TRACK_NORMAL = 2
@@ -28,12 +58,18 @@ SIGNAL_CLEAR_COLOR = 'green'
 SIGNAL_DANGER_COLOR = 'red'
 SIGNAL_GUI_BUTTON = True
 SIGNAL_WAIT_FOR_SET = False
+SIGNAL_SET_TIMEOUT = 10 # Seconds
+SIGNAL_BUSY_COLOR = 'orange'
 TURNOUT_NORMAL_COLOR = 'yellow'
 TURNOUT_SAFE_COLOR = 'green'
 TURNOUT_DANGER_COLOR = 'red'
 TURNOUT_POINT_COLOR = 'blue'
+TURNOUT_BUSY_COLOR = 'orange'
 TURNOUT_GUI_BUTTON = True
 TURNOUT_WAIT_FOR_SET = False
+TURNOUT_SET_TIMEOUT = 10 # Seconds
+INPUT_DEBOUNCE = 0.05 # Seconds
+INPUT_COALESCE_WINDOW = 0.15 # Seconds
 BLOCK_LABEL_COLOR = 'blue'
 ROUTE_GUI_BUTTON = True
 LAYOUT_LABEL_COLOR = 'blue'
@@ -41,6 +77,485 @@ LAYOUT_BACKGROUND_COLOR = 'light gray'
 APPLICATION_THEME = 'LightGray2'
 
 _supervisors = {}
+_supervisor_news = {}
+_dispatcher = None
+_headless_loop = None
+_supervisor_records = {}
+_tracer = None
+SUPERVISOR_PROTOCOL = 'text' # or 'binary'
+SUPERVISOR_POLL_INTERVAL = 0.1 # Seconds between status requests to supervisors without news
+SUPERVISOR_TIMEOUT = 5 # Seconds to wait for a reply from a supervisor
+SUPERVISOR_DISCOVER_TIMEOUT = 60 # Seconds to look for a supervisor
+
+def _trace_begin(name):
+    # Start tracing a request while a layout is run with tracing on, returns the
+    # trace id, name and start time of the request or None. For a request made by a
+    # press the time from the first press until it was acted on is recorded too
+    if _tracer is None:
+        return None
+    now = _tracer.now()
+    trace = (_tracer.new_trace(), name, now)
+    if _inputs.acting is not None:
+        _tracer.add('input', trace[0], _inputs.acting, now, 'panel')
+    return trace
+
+def _trace_span(name, trace, **args):
+    if trace is None:
+        return nullcontext()
+    return _tracer.span(name, trace[0], 'panel', **args)
+
+def _trace_end(trace, **args):
+    # The whole request as a single span
+    if trace:
+        _tracer.add(trace[1], trace[0], trace[2], _tracer.now(), 'request', **args)
+
+def _trace_finish(finish, trace, statuses):
+    with _trace_span('show', trace):
+        finish(statuses)
+    _trace_end(trace, statuses = statuses)
+
+def _supervisor_send(supervisor, message, trace = None):
+    # trace is from _trace_begin, its id is sent in front of the message
+    if supervisor not in _supervisors:
+        _discover_supervisors([supervisor])
+    trace_id = trace[0] if trace else None
+    records = _supervisor_records.get(supervisor)
+    if records and message in records:
+        return WireProtocol.decode_reply(_supervisor_message(supervisor, Tracing.tag(trace_id, records[message])))[0]
+    return _supervisor_message(supervisor, Tracing.tag(trace_id, message))
+
+def _supervisor_message(supervisor, message):
+    # Every message to a supervisor waits at most SUPERVISOR_TIMEOUT for the reply.
+    # A timed out socket is still waiting for its reply and can't be sent on again,
+    # so it is closed and the next message to the supervisor gets a new one
+    address = _supervisors[supervisor]
+    try:
+        return nw0.send_message_to(address, message, wait_for_reply_s = SUPERVISOR_TIMEOUT)
+    except nw0.core.SocketTimedOutError:
+        _discard_socket(address)
+        raise RuntimeError('No reply from supervisor ' + supervisor + ' within ' + str(SUPERVISOR_TIMEOUT) + ' seconds')
+
+def _discard_socket(address):
+    # networkzero keeps a socket for each address in each thread and has no way to
+    # drop one, so this reaches into its private state. Should that not be there,
+    # as in some other version of networkzero, the socket is left alone and later
+    # messages to the supervisor from this thread fail as well
+    try:
+        sockets = nw0.sockets._sockets._tls.sockets
+        address = nw0.core.address(address)
+    except AttributeError:
+        return
+    speaker = sockets.pop(address, None)
+    if speaker is not None:
+        speaker.close(linger = 0)
+
+def _discover_supervisors(names):
+    # Discovery can take a while so all of the supervisors are looked for at once
+    # rather than one after another
+    names = [name for name in set(names) if name not in _supervisors]
+    if names:
+        with ThreadPoolExecutor(max_workers = len(names)) as executor:
+            addresses = list(executor.map(lambda name: nw0.discover(name, wait_for_s = SUPERVISOR_DISCOVER_TIMEOUT), names))
+        for name, address in zip(names, addresses):
+            if address is None:
+                sg.popup_error('Unable to discover supervisor ' + name, title = 'No supervisor found')
+                exit()
+            _supervisors[name] = address
+
+def _supervisor_inventory(supervisor, items):
+    # Everything the supervisor looks after as a set of 'kind:id', supervisors that
+    # can't give an inventory are asked about each item in turn instead
+    inventory = _supervisor_send(supervisor, 'inventory')
+    if inventory != 'error':
+        return set(inventory.split('|'))
+    inventory = set()
+    for item in items:
+        topic = item.SUPERVISOR_KIND + ':' + item.id
+        if _supervisor_send(supervisor, 'exists:' + topic) == 'ok':
+            inventory.add(topic)
+    return inventory
+
+def _check_supervisors(items):
+    # Find all of the supervisors the items use, ask each of them once for their
+    # inventory and check that every item is in the inventory of its supervisor
+    supervised = {}
+    for item in items:
+        supervised.setdefault(item.supervisor, []).append(item)
+    _discover_supervisors(supervised)
+    names = list(supervised)
+    if names:
+        with ThreadPoolExecutor(max_workers = len(names)) as executor:
+            inventories = list(executor.map(lambda name: _supervisor_inventory(name, supervised[name]), names))
+        missing = []
+        for name, inventory in zip(names, inventories):
+            for item in supervised[name]:
+                if item.SUPERVISOR_KIND + ':' + item.id not in inventory:
+                    missing.append(type(item).__name__ + " '" + item.id + "' does not exist on Supervisor " + name)
+        if missing:
+            sg.popup_error(*missing, title = 'Non-existant items')
+            exit()
+        if SUPERVISOR_PROTOCOL == 'binary':
+            for name in names:
+                _supervisor_register(name, supervised[name])
+
+def _supervisor_register(supervisor, items):
+    # Get the handle of each item from the supervisor so that commands can be sent
+    # in the compact binary form, a supervisor that doesn't know about handles is
+    # carried on with using text
+    topics = [item.SUPERVISOR_KIND + ':' + item.id for item in items]
+    reply = _supervisor_send(supervisor, 'register:' + '|'.join(topics))
+    if reply != 'error':
+        records = {}
+        for item, handle in zip(items, reply.split('|')):
+            records.update(WireProtocol.records_for(item.SUPERVISOR_KIND, item.id, int(handle)))
+        _supervisor_records[supervisor] = records
+
+def _supervisor_batch(supervisor, commands, trace = None):
+    # Send a number of commands to a supervisor in a single round trip and
+    # return the status of each one, if the supervisor does not understand
+    # batches then fall back to sending the commands one at a time
+    if len(commands) == 1:
+        return [_supervisor_send(supervisor, commands[0], trace)]
+    records = _supervisor_records.get(supervisor)
+    if records and all(command in records for command in commands):
+        message = WireProtocol.join([records[command] for command in commands])
+        statuses = WireProtocol.decode_reply(_supervisor_message(supervisor, Tracing.tag(trace[0] if trace else None, message)))
+        if len(statuses) != len(commands):
+            # The supervisor could not decode the message
+            statuses = ['error'] * len(commands)
+        return statuses
+    statuses = _supervisor_send(supervisor, 'batch:' + '|'.join(commands), trace).split('|')
+    if len(statuses) != len(commands):
+        statuses = [_supervisor_send(supervisor, command, trace) for command in commands]
+    return statuses
+
+class _CompletionListener(threading.Thread):
+    # Listens for the news a supervisor publishes as each item reaches its position
+    # and sets the event of anyone waiting for that item to reach that position.
+    # News of an earlier move to another position is ignored
+    def __init__(self, address):
+        super().__init__(name = 'CompletionListener', daemon = True)
+        self.address = address
+        self.lock = threading.Lock()
+        self.expected = {}
+        # Set once the subscription has had time to connect, news published before
+        # then is never seen
+        self.ready = threading.Event()
+
+    def expect(self, topic, position):
+        event = threading.Event()
+        with self.lock:
+            self.expected[topic] = (position, event)
+        return event
+
+    def run(self):
+        wait = SUPERVISOR_POLL_INTERVAL
+        while True:
+            topic, position = nw0.wait_for_news_from(self.address, wait_for_s = wait)
+            self.ready.set()
+            wait = SUPERVISOR_TIMEOUT
+            if topic is None:
+                continue
+            with self.lock:
+                expected = self.expected.get(topic)
+                if expected is None or expected[0] != position:
+                    continue
+                del self.expected[topic]
+            expected[1].set()
+
+def _supervisor_expect(supervisor, topic, position):
+    # Must be called before the command is sent so that the news cannot be missed,
+    # returns None if the supervisor does not publish news. This talks to the
+    # supervisor so it is done in the background with the rest of a request
+    if supervisor not in _supervisor_news:
+        address = _supervisor_send(supervisor, 'news')
+        if address == 'error':
+            _supervisor_news[supervisor] = None
+        else:
+            _supervisor_news[supervisor] = _CompletionListener(address)
+            _supervisor_news[supervisor].start()
+            _supervisor_news[supervisor].ready.wait(SUPERVISOR_TIMEOUT)
+    if _supervisor_news[supervisor]:
+        return _supervisor_news[supervisor].expect(topic, position)
+    return None
+
+def _supervisor_wait(supervisor, topic, arrival, timeout):
+    # Wait for an item to reach its position and return 'set', or the status from
+    # the supervisor if it doesn't get there in time. Supervisors that don't
+    # publish news are asked for the status at intervals instead
+    if arrival is not None:
+        if arrival.wait(timeout):
+            return 'set'
+        status = _supervisor_send(supervisor, 'status:' + topic)
+    else:
+        give_up = monotonic() + timeout
+        while True:
+            status = _supervisor_send(supervisor, 'status:' + topic)
+            if not status.startswith('moving') or monotonic() > give_up:
+                break
+            sleep(SUPERVISOR_POLL_INTERVAL)
+    if status.startswith('moving'):
+        status = 'Timed out at ' + status[7:] + '%'
+    return status
+
+def _supervisor_batches(legs):
+    # Group the legs by supervisor, giving the indexes of the legs for each supervisor
+    # and the commands to send it
+    batches = {}
+    for ndx, (item, position) in enumerate(legs):
+        if item.supervisor not in batches:
+            batches[item.supervisor] = ([], [])
+        batches[item.supervisor][0].append(ndx)
+        batches[item.supervisor][1].append(item._supervisor_command(position))
+    return batches
+
+def _supervisor_set_all(legs, batches = None, trace = None):
+    # legs is a list of (item, position), the items for each supervisor are sent as
+    # a single batch and then waited for if need be. Returns the status of each leg,
+    # 'ok' if it is in position. This does no GUI work so it can be run in the
+    # background
+    if batches is None:
+        batches = _supervisor_batches(legs)
+    statuses = [None] * len(legs)
+    for supervisor in batches:
+        ndxs, commands = batches[supervisor]
+        try:
+            for ndx in ndxs:
+                legs[ndx][0]._supervisor_listen(legs[ndx][1])
+            with _trace_span('round trip ' + supervisor, trace, commands = len(commands)):
+                replies = _supervisor_batch(supervisor, commands, trace)
+            with _trace_span('wait for set ' + supervisor, trace):
+                for ndx, status in zip(ndxs, replies):
+                    statuses[ndx] = legs[ndx][0]._supervisor_result(legs[ndx][1], status)
+        except Exception as error:
+            for ndx in ndxs:
+                statuses[ndx] = str(error)
+    return statuses
+
+def _supervisor_request(legs, finish, batches = None, trace = None):
+    # Get supervisors to move the legs and then call finish with the statuses. When
+    # the GUI is running the supervisors are talked to in the background and finish
+    # is called back on the GUI thread, otherwise everything is done before returning
+    for item, position in legs:
+        item._supervisor_prepare()
+    if trace:
+        finish = partial(_trace_finish, finish, trace)
+    if _dispatcher:
+        for item, position in legs:
+            item._show_busy()
+        _dispatcher.submit(lambda: _supervisor_set_all(legs, batches, trace), finish, trace)
+    else:
+        finish(_supervisor_set_all(legs, batches, trace))
+
+class _SupervisorDispatcher:
+    # Runs supervisor requests on a background thread so that the window doesn't
+    # freeze while waiting for replies. A single worker keeps the requests in the
+    # order they were made
+    EVENT = '+supervisor+'
+
+    def __init__(self, window):
+        self.window = window
+        self.executor = ThreadPoolExecutor(max_workers = 1)
+        self.closed = False
+
+    def submit(self, work, finish, trace = None):
+        # A traced request also records how long it waited for the worker and how
+        # long the result waited for the GUI thread
+        submitted = monotonic()
+        def run():
+            if trace:
+                _tracer.add('queued', trace[0], submitted, monotonic(), 'panel')
+            result = work()
+            if self.closed:
+                return
+            posted = monotonic()
+            def show():
+                if trace:
+                    _tracer.add('gui wait', trace[0], posted, monotonic(), 'panel')
+                finish(result)
+            self.window.write_event_value(_SupervisorDispatcher.EVENT, show)
+        self.executor.submit(run)
+
+    def post(self, work):
+        # Run work on the GUI thread
+        if not self.closed:
+            self.window.write_event_value(_SupervisorDispatcher.EVENT, work)
+
+    def shutdown(self):
+        # Requests that haven't started are dropped and the one being worked on, if
+        # any, is left to time out on its own so that closing the window never waits
+        self.closed = True
+        self.executor.shutdown(wait = False, cancel_futures = True)
+
+class _HeadlessLoop:
+    # Everything that happens while running headless, keys, push buttons and commands
+    # from the control socket, is dealt with one at a time on the thread running the
+    # loop. Other threads post work to a queue and wake the selector through a socket
+    # pair so nothing is ever done by two threads at once
+    def __init__(self, layout, keyboard_events, control = None):
+        self.layout = layout
+        self.keyboard_events = keyboard_events
+        self.selector = selectors.DefaultSelector()
+        self.queue = queue.SimpleQueue()
+        self.running = False
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ, self._wakeup)
+        self.terminal = None
+        self.key_reader = None
+        if sys.stdin.isatty():
+            if os.name == 'posix':
+                # Keys are only seen by select as they are typed in cbreak mode
+                import termios
+                import tty
+                self.terminal = termios.tcgetattr(sys.stdin)
+                tty.setcbreak(sys.stdin)
+                self.selector.register(sys.stdin, selectors.EVENT_READ, self._stdin)
+            else:
+                # stdin can't be selected on so a thread waits for keys instead
+                self.key_reader = threading.Thread(target = self._read_keys, name = 'KeyReader', daemon = True)
+        self.control_path = None
+        self.control = None
+        if control is not None:
+            if isinstance(control, str):
+                # A Unix socket at the given path
+                if os.path.exists(control):
+                    os.unlink(control)
+                self.control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.control.bind(control)
+                self.control_path = control
+            else:
+                # A TCP port, or (host, port), defaults to local connections only
+                if isinstance(control, int):
+                    control = ('127.0.0.1', control)
+                self.control = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.control.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.control.bind(control)
+            self.control.listen()
+            self.control.setblocking(False)
+            self.selector.register(self.control, selectors.EVENT_READ, self._accept)
+
+    def post(self, work):
+        # Safe to call from any thread
+        self.queue.put(work)
+        try:
+            self.wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            # Already plenty of wake ups waiting to be read
+            pass
+
+    def stop(self):
+        self.running = False
+
+    def _wakeup(self, unused):
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while True:
+            try:
+                work = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            work()
+
+    def _key(self, event):
+        print('event', event)
+        if event == getkey.keys.ENTER:
+            self.stop()
+        elif event in self.keyboard_events:
+            self.layout._press(self.keyboard_events[event])
+
+    def _stdin(self, unused):
+        event = getkey.getkey(blocking = False)
+        if event:
+            self._key(event)
+
+    def _read_keys(self):
+        while True:
+            event = getkey.getkey()
+            self.post(partial(self._key, event))
+            if event == getkey.keys.ENTER:
+                break
+
+    def _accept(self, unused):
+        try:
+            connection, address = self.control.accept()
+        except (BlockingIOError, OSError):
+            return
+        connection.setblocking(False)
+        self.selector.register(connection, selectors.EVENT_READ, _ControlConnection(self, connection))
+
+    def run(self):
+        self.running = True
+        if self.key_reader:
+            self.key_reader.start()
+        try:
+            while self.running:
+                for key, unused in self.selector.select(_inputs.timeout()):
+                    key.data(key)
+                    if not self.running:
+                        break
+                _inputs.run_due()
+        finally:
+            self.close()
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            if isinstance(key.data, _ControlConnection):
+                key.data.close()
+        if self.terminal is not None:
+            import termios
+            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self.terminal)
+            self.terminal = None
+        if self.control:
+            self.control.close()
+            self.control = None
+            if self.control_path:
+                os.unlink(self.control_path)
+        self.selector.close()
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+class _ControlConnection:
+    # A client of the control socket, each line it sends is a command and each
+    # command gets a line back, ok or error
+    def __init__(self, loop, connection):
+        self.loop = loop
+        self.connection = connection
+        self.buffer = b''
+
+    def __call__(self, unused):
+        try:
+            data = self.connection.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.close()
+            return
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        replies = []
+        for line in lines:
+            command = line.decode('utf-8', 'replace').strip()
+            if command:
+                replies.append(self.loop.layout._control_command(command, self.loop))
+        if replies:
+            try:
+                self.connection.sendall(('\n'.join(replies) + '\n').encode('utf-8'))
+            except OSError:
+                self.close()
+
+    def close(self):
+        try:
+            self.loop.selector.unregister(self.connection)
+        except (KeyError, ValueError):
+            pass
+        self.connection.close()
 
 def set_default(item, value):
     _item = item.upper()
@@ -74,6 +589,12 @@ def set_default(item, value):
     elif _item == 'SIGNAL_WAIT_FOR_SET':
         global SIGNAL_WAIT_FOR_SET
         SIGNAL_WAIT_FOR_SET = value
+    elif _item == 'SIGNAL_SET_TIMEOUT':
+        global SIGNAL_SET_TIMEOUT
+        SIGNAL_SET_TIMEOUT = value
+    elif _item == 'SIGNAL_BUSY_COLOR':
+        global SIGNAL_BUSY_COLOR
+        SIGNAL_BUSY_COLOR = value
     elif _item == 'TURNOUT_NORMAL_COLOR':
         global TURNOUT_NORMAL_COLOR
         TURNOUT_NORMAL_COLOR = value
@@ -86,12 +607,24 @@ def set_default(item, value):
     elif _item == 'TURNOUT_POINT_COLOR':
         global TURNOUT_POINT_COLOR
         TURNOUT_POINT_COLOR = value
+    elif _item == 'TURNOUT_BUSY_COLOR':
+        global TURNOUT_BUSY_COLOR
+        TURNOUT_BUSY_COLOR = value
     elif _item == 'TURNOUT_GUI_BUTTON':
         global TURNOUT_GUI_BUTTON
         TURNOUT_GUI_BUTTON = value
     elif _item == 'TURNOUT_WAIT_FOR_SET':
         global TURNOUT_WAIT_FOR_SET
         TURNOUT_WAIT_FOR_SET = value
+    elif _item == 'TURNOUT_SET_TIMEOUT':
+        global TURNOUT_SET_TIMEOUT
+        TURNOUT_SET_TIMEOUT = value
+    elif _item == 'INPUT_DEBOUNCE':
+        global INPUT_DEBOUNCE
+        INPUT_DEBOUNCE = value
+    elif _item == 'INPUT_COALESCE_WINDOW':
+        global INPUT_COALESCE_WINDOW
+        INPUT_COALESCE_WINDOW = value
     elif _item == 'BLOCK_LABEL_COLOR':
         global BLOCK_LABEL_COLOR
         BLOCK_LABEL_COLOR = value
@@ -107,22 +640,65 @@ def set_default(item, value):
     elif _item == 'TRACK_WIDTH':
         global TRACK_WIDTH
         TRACK_WIDTH = value
+    elif _item == 'SUPERVISOR_PROTOCOL':
+        global SUPERVISOR_PROTOCOL
+        SUPERVISOR_PROTOCOL = value
+    elif _item == 'SUPERVISOR_TIMEOUT':
+        global SUPERVISOR_TIMEOUT
+        SUPERVISOR_TIMEOUT = value
+    elif _item == 'SUPERVISOR_DISCOVER_TIMEOUT':
+        global SUPERVISOR_DISCOVER_TIMEOUT
+        SUPERVISOR_DISCOVER_TIMEOUT = value
     elif _item == 'APPLICATION_THEME':
         global APPLICATION_THEME
         APPLICATION_THEME = value
     else:
         raise ValueError(f'Invalid item for setting of default value: item = {item}, value = {value}')
 
-def _get_screen_size():
-    layout = [[]]
-    window = sg.Window('', layout, finalize = True)
-    size = window.get_screen_size()
-    window.close()
-    return size
+class _CanvasUpdates:
+    # Changes of colour are collected while an event is handled and applied once
+    # before the window is next read, so only the final colour of each figure is
+    # sent to Tk and figures that already have that colour are left alone. Outside
+    # of the window loop changes are applied straight away
+    def __init__(self):
+        self.batching = False
+        self.dirty = {}
+        self.applied = {}
+
+    def drawn(self, panel, graph_id, **options):
+        self.applied[(panel, graph_id)] = options
+
+    def erased(self, panel, graph_id):
+        self.applied.pop((panel, graph_id), None)
+        self.dirty.pop((panel, graph_id), None)
+
+    def configure(self, panel, graph_id, **options):
+        if self.batching:
+            self.dirty.setdefault((panel, graph_id), {}).update(options)
+        else:
+            self._apply(panel, graph_id, options)
 
-class PushButton(Button):
-    PUSH_DEBOUNCE = timedelta(seconds = 0.25)
+    def _apply(self, panel, graph_id, options):
+        applied = self.applied.setdefault((panel, graph_id), {})
+        changed = {}
+        for option in options:
+            if applied.get(option) != options[option]:
+                changed[option] = options[option]
+        if changed:
+            panel.tk_canvas.itemconfigure(graph_id, **changed)
+            applied.update(changed)
 
+    def flush(self):
+        dirty, self.dirty = self.dirty, {}
+        for (panel, graph_id), options in dirty.items():
+            self._apply(panel, graph_id, options)
+
+_canvas_updates = _CanvasUpdates()
+
+# Debounces and coalesces presses while a layout is running
+_inputs = InputEngine()
+
+class PushButton(Button):
     def __init__(self, button_id, pin_id, callback):
         '''
         The pin ID should be a GPIO pin number
@@ -130,16 +706,62 @@ class PushButton(Button):
         super().__init__(pin_id, bounce_time = None)
         self.button_id = button_id
         self.callback = callback
-        self.last_push = dt.now()
+        # False if every press does the same thing rather than toggling something
+        self.toggles = True
         self.when_pressed = self.pushed
     
     def pushed(self):
-        now = dt.now()
-        if now - self.last_push >= PushButton.PUSH_DEBOUNCE:
-            self.last_push = now
-            if self.callback:
+        if self.callback:
+            # The press is timed here but debounced and acted on by the thread that
+            # runs the layout rather than the GPIO thread. Without a layout running
+            # it is only debounced
+            now = monotonic()
+            press = partial(_inputs.press, self, self.callback, now, self.toggles)
+            if _headless_loop:
+                _headless_loop.post(press)
+            elif _dispatcher:
+                _dispatcher.post(press)
+            elif _inputs.debounced(self, now):
                 self.callback()
 
+class RoutePlan:
+    # A route worked out ready to run. Each item appears once with the position it
+    # is to end up in, in the place of the last leg that sets it, and the commands
+    # for each supervisor are made up front so running the plan is a single request
+    def __init__(self, legs):
+        self.targets = {}
+        for leg, does in legs:
+            self.targets.pop(leg, None)
+            self.targets[leg] = does
+        self.legs = list(self.targets.items())
+        self.supervised = []
+        self.local = []
+        for leg, does in self.legs:
+            if isinstance(leg, (Turnout, Signal)) and leg.supervisor and does in leg.SUPERVISOR_POSITIONS:
+                self.supervised.append((leg, does))
+            else:
+                self.local.append((leg, does))
+        self.batches = _supervisor_batches(self.supervised)
+
+    def run(self, trace = None, failed = None):
+        # failed is called if any of the supervised legs could not be set
+        if self.supervised:
+            _supervisor_request(self.supervised, partial(self._finish, failed), self.batches, trace)
+        else:
+            with _trace_span('show', trace):
+                self._finish(failed, [])
+            _trace_end(trace)
+
+    def _finish(self, failed, statuses):
+        statuses = dict(zip(self.supervised, statuses))
+        for leg, does in self.legs:
+            if (leg, does) in statuses:
+                leg._supervisor_show(does, statuses[(leg, does)])
+            else:
+                getattr(leg, does)()
+        if failed and any(status != 'ok' for status in statuses.values()):
+            failed()
+
 class Route:
     def __init__(self, id, gui_button = None, push_button = None, keyboard_event = None):
         self.id = id
@@ -148,20 +770,57 @@ class Route:
         else:
             self.gui_button = gui_button
         if isinstance(push_button, int):
-            self.push_button = PushButton(button_id = id, pin_id = push_button, callback = self.run)
+            self.push_button = PushButton(button_id = id, pin_id = push_button, callback = self.toggle)
+            # Until a layout gives the route an interlocking every press sets it
+            self.push_button.toggles = False
         elif isinstance(push_button, PushButton):
             self.push_button = push_button
         else:
             self.push_button = None
         self.keyboard_event = keyboard_event
         self.legs = []
+        self.plan = None
+        # Set by the layout when it has an interlocking
+        self.interlocking = None
 
     def add(self, leg, does):
-        self.legs.append(getattr(leg, does))
+        # Make sure that the leg can actually do what is asked of it
+        getattr(leg, does)
+        self.legs.append((leg, does))
+        self.plan = None
+
+    def compile(self):
+        self.plan = RoutePlan(self.legs)
+        return self.plan
 
     def run(self):
-        for leg in self.legs:
-            leg()
+        # Returns False if the interlocking refuses the route because a conflicting
+        # route is set
+        trace = _trace_begin('route ' + self.id)
+        if self.interlocking and not self.interlocking.lock(self):
+            _trace_end(trace, refused = True)
+            return False
+        if self.plan is None:
+            with _trace_span('compile', trace):
+                self.compile()
+        # A route that could not be set is not left locked
+        self.plan.run(trace, self.release)
+        return True
+
+    def release(self):
+        # Returns False if the route was not locked
+        return self.interlocking is not None and self.interlocking.release(self)
+
+    def is_locked(self):
+        return self.interlocking is not None and self.interlocking.is_locked(self)
+
+    def toggle(self):
+        # Without an interlocking a route is simply set again. Returns False if the
+        # route is refused
+        if self.is_locked():
+            self.release()
+            return True
+        return self.run()
 
 class Track:
     class _Iterator:
@@ -223,23 +882,32 @@ class Track:
                 color = self.danger_color
             if self.panel:
                 self.graph_id = self.panel.draw_line(self.start_location, self.end_location, color = color, width = TRACK_WIDTH)
+                _canvas_updates.drawn(self.panel, self.graph_id, fill = color)
 
     def clicked(self, figures):
         pass
 
+    def add_clickable(self, index):
+        pass
+
+    def add_topology(self, topology):
+        if self.start_location and self.end_location:
+            topology.add_track(self, self.start_location, self.end_location)
+
     def erase(self):
         if self.panel:
+            _canvas_updates.erased(self.panel, self.graph_id)
             self.panel.delete_figure(self.graph_id)
 
     def safe(self):
         self.state = TRACK_SAFE
         if self.panel:
-            self.panel.tk_canvas.itemconfigure(self.graph_id, fill = self.safe_color)
+            _canvas_updates.configure(self.panel, self.graph_id, fill = self.safe_color)
 
     def danger(self):
         self.state = TRACK_DANGER
         if self.panel:
-            self.panel.tk_canvas.itemconfigure(self.graph_id, fill = self.danger_color)
+            _canvas_updates.configure(self.panel, self.graph_id, fill = self.danger_color)
 
 class Stub:
     class _Iterator:
@@ -271,7 +939,7 @@ class Stub:
         return self.track.get_start_location()
     
     def get_end_location(self):
-        return self.get_end_location()
+        return self.track.get_end_location()
 
     def set_panel(self, panel):
         self.track.set_panel(panel)
@@ -282,10 +950,20 @@ class Stub:
     def clicked(self, figures):
         pass
 
+    def add_clickable(self, index):
+        pass
+
+    def add_topology(self, topology):
+        if self.get_start_location() and self.get_end_location():
+            topology.add_track(self, self.get_start_location(), self.get_end_location())
+
     def erase(self):
         self.track.erase()
 
 class Signal:
+    SUPERVISOR_KIND = 'signal'
+    SUPERVISOR_POSITIONS = ('clear', 'danger')
+
     class _Iterator:
         def __init__(self, item):
             self._item = item
@@ -325,47 +1003,48 @@ class Signal:
         else:
             self.wait_for_set = wait_for_set
         self.keyboard_event = keyboard_event
+        # The supervisor is found and checked for this signal when the layout is run
         self.supervisor = supervisor
-        if self.supervisor:
-            if self.supervisor not in _supervisors:
-                sv = nw0.discover(self.supervisor)
-                if sv is None:
-                    sg.popup_error('Unable to discover supervisor ' + self.supervisor, title = 'No supervisor found')
-                    exit()
-                else:
-                    _supervisors[self.supervisor] = sv
-            status = nw0.send_message_to(_supervisors[self.supervisor], 'exists:signal:' + self.id)
-            if status != 'ok':
-                sg.popup_error("Signal '" + self.id + "' does not exist on Supervisor " + self.supervisor, title = 'Non-existant Signal')
-                exit()
         self.inform = inform
         self.respond = respond
+        self.arrival = None
         self.graph_id = None
         self.panel = None
 
     def __iter__(self):
         return self._Iterator()
 
-    def _supervisor_set(self, position):
+    def _supervisor_command(self, position):
+        return 'set:signal:' + self.id + ':' + position
+
+    def _supervisor_prepare(self):
+        pass
+
+    def _supervisor_listen(self, position):
+        # Called in the background when the GUI is running, before the command is sent
+        if self.wait_for_set:
+            self.arrival = _supervisor_expect(self.supervisor, 'signal:' + self.id, position)
+
+    def _supervisor_result(self, position, status):
+        # Called in the background when the GUI is running
+        if status == 'ok' and self.wait_for_set:
+            status = _supervisor_wait(self.supervisor, 'signal:' + self.id, self.arrival, SIGNAL_SET_TIMEOUT)
+            if status == 'set':
+                status = 'ok'
+        return status
+
+    def _supervisor_show(self, position, status):
+        if status == 'ok':
+            self._set_state(position)
+        else:
+            sg.popup_error(status, 'Error setting signal ' + self.id + ' to ' + position, title = 'Error setting signal')
+
+    def _request(self, position):
         if self.supervisor:
-            status = nw0.send_message_to(_supervisors[self.supervisor], 'set:signal:' + self.id + ':' + position)
-            if status == 'ok':
-                while self.wait_for_set:
-                    status = nw0.send_message_to(_supervisors[self.supervisor], 'status:signal:' + self.id)
-                    response = status.split(':')
-                    if response[0] == 'set':
-                        break
-                    elif response[0] == 'moving':
-                        continue
-                    else:
-                        sg.popup_error(status, 'Error getting status of signal ' + self.id, title = 'Status error')
-                        return False
-                return True
-            else:
-                sg.popup_error(status, 'Error setting signal ' + self.id + ' to ' + position, title = 'Error setting signal')
-                return False
+            trace = _trace_begin('signal ' + self.id + ' ' + position)
+            _supervisor_request([(self, position)], lambda statuses: self._supervisor_show(position, statuses[0]), trace = trace)
         else:
-            return True
+            self._set_state(position)
 
     def set_supervisor_state(self):
         if self.supervisor:
@@ -374,17 +1053,25 @@ class Signal:
             elif self.state == SIGNAL_CLEAR:
                 self.clear()
 
-    def clear(self):
-        if self._supervisor_set('clear'):
+    def _set_state(self, position):
+        if position == 'clear':
             self.state = SIGNAL_CLEAR
-            if self.panel:
-                self.panel.tk_canvas.itemconfigure(self.graph_id, fill = self.clear_color, outline = self.clear_color)
+            color = self.clear_color
+        else:
+            self.state = SIGNAL_DANGER
+            color = self.danger_color
+        if self.panel:
+            _canvas_updates.configure(self.panel, self.graph_id, fill = color, outline = color)
+
+    def _show_busy(self):
+        if self.panel:
+            _canvas_updates.configure(self.panel, self.graph_id, fill = SIGNAL_BUSY_COLOR, outline = SIGNAL_BUSY_COLOR)
+
+    def clear(self):
+        self._request('clear')
 
     def danger(self):
-        if self._supervisor_set('danger'):
-            self.state = SIGNAL_DANGER
-            if self.panel:
-                self.panel.tk_canvas.itemconfigure(self.graph_id, fill = self.danger_color, outline = self.danger_color)
+        self._request('danger')
 
     def toggle(self):
         if self.state == SIGNAL_CLEAR:
@@ -405,16 +1092,28 @@ class Signal:
                 color = self.danger_color
             if self.panel:
                 self.graph_id = self.panel.draw_circle(self.location, 10, fill_color = color, line_color = color)
+                _canvas_updates.drawn(self.panel, self.graph_id, fill = color, outline = color)
 
     def clicked(self, figures):
         if self.graph_id in figures:
             self.toggle()
 
+    def add_clickable(self, index):
+        if self.location:
+            index.add_circle(self.location, 10, self)
+
+    def add_topology(self, topology):
+        pass
+
     def erase(self):
         if self.panel:
+            _canvas_updates.erased(self.panel, self.graph_id)
             self.panel.delete_figure(self.graph_id)
 
 class Turnout:
+    SUPERVISOR_KIND = 'turnout'
+    SUPERVISOR_POSITIONS = ('normal', 'reverse')
+
     class _Iterator:
         def __init__(self, item):
             self._item = item
@@ -470,51 +1169,51 @@ class Turnout:
         else:
             self.wait_for_set = wait_for_set
         self.keyboard_event = keyboard_event
+        # The supervisor is found and checked for this turnout when the layout is run
         self.supervisor = supervisor
-        if self.supervisor:
-            if self.supervisor not in _supervisors:
-                sv = nw0.discover(self.supervisor)
-                if sv is None:
-                    sg.popup_error('Unable to discover supervisor ' + self.supervisor, title = 'No supervisor found')
-                    exit()
-                else:
-                    _supervisors[self.supervisor] = sv
-            status = nw0.send_message_to(_supervisors[self.supervisor], 'exists:turnout:' + self.id)
-            if status != 'ok':
-                sg.popup_error("Turnout '" + self.id + "' does not exist on Supervisor " + self.supervisor, title = 'Non-existant turnout')
-                exit()
         self.inform = inform
         self.respond = respond
+        self.arrival = None
         self.point_circle_graph_id = None
         self.state = 'N'
         self.panel = None
 
     def __iter__(self):
         return self._Iterator()
-    
-    def _supervisor_set(self, position):
+
+    def _supervisor_command(self, position):
+        return 'set:turnout:' + self.id + ':' + position
+
+    def _supervisor_prepare(self):
+        self.normal_track.danger()
+        self.reverse_track.danger()
+        self.state = 'I' # Indeterminate
+
+    def _supervisor_listen(self, position):
+        # Called in the background when the GUI is running, before the command is sent
+        if self.wait_for_set:
+            self.arrival = _supervisor_expect(self.supervisor, 'turnout:' + self.id, position)
+
+    def _supervisor_result(self, position, status):
+        # Called in the background when the GUI is running
+        if status == 'ok' and self.wait_for_set:
+            status = _supervisor_wait(self.supervisor, 'turnout:' + self.id, self.arrival, TURNOUT_SET_TIMEOUT)
+            if status == 'set':
+                status = 'ok'
+        return status
+
+    def _supervisor_show(self, position, status):
+        if status == 'ok':
+            self._set_state(position)
+        else:
+            sg.popup_error(status, 'Error setting turnout ' + self.id + ' to ' + position, title = 'Error setting turnout')
+
+    def _request(self, position):
         if self.supervisor:
-            self.normal_track.danger()
-            self.reverse_track.danger()
-            self.state = 'I' # Indeterminate
-            status = nw0.send_message_to(_supervisors[self.supervisor], 'set:turnout:' + self.id + ':' + position)
-            if status == 'ok':
-                while self.wait_for_set:
-                    status = nw0.send_message_to(_supervisors[self.supervisor], 'status:turnout:' + self.id)
-                    response = status.split(':')
-                    if response[0] == 'set':
-                        break
-                    elif response[0] == 'moving':
-                        continue
-                    else:
-                        sg.popup_error(status, 'Error getting status of turnout ' + self.id, title = 'Status error')
-                        return False
-                return True
-            else:
-                sg.popup_error(status, 'Error setting turnout ' + self.id + ' to ' + position, title = 'Error setting turnout')
-                return False
+            trace = _trace_begin('turnout ' + self.id + ' ' + position)
+            _supervisor_request([(self, position)], lambda statuses: self._supervisor_show(position, statuses[0]), trace = trace)
         else:
-            return True
+            self._set_state(position)
     
     def set_supervisor_state(self):
         if self.supervisor:
@@ -532,17 +1231,27 @@ class Turnout:
     def get_reverse_location(self):
         return self.reverse_location
 
-    def normal(self):
-        if self._supervisor_set('normal'):
+    def _set_state(self, position):
+        if position == 'normal':
             self.normal_track.safe()
             self.reverse_track.danger()
             self.state = 'N'
-
-    def reverse(self):
-        if self._supervisor_set('reverse'):
+        else:
             self.normal_track.danger()
             self.reverse_track.safe()
             self.state = 'R'
+        if self.panel:
+            _canvas_updates.configure(self.panel, self.point_circle_graph_id, fill = self.point_color, outline = self.point_color)
+
+    def _show_busy(self):
+        if self.panel:
+            _canvas_updates.configure(self.panel, self.point_circle_graph_id, fill = TURNOUT_BUSY_COLOR, outline = TURNOUT_BUSY_COLOR)
+
+    def normal(self):
+        self._request('normal')
+
+    def reverse(self):
+        self._request('reverse')
 
     def toggle(self):
         if self.state == 'R':
@@ -562,17 +1271,27 @@ class Turnout:
         self.reverse_track.draw()
         if self.panel:
             self.point_circle_graph_id = self.panel.draw_circle(self.location, 10, fill_color = self.point_color, line_color = self.point_color)
+            _canvas_updates.drawn(self.panel, self.point_circle_graph_id, fill = self.point_color, outline = self.point_color)
 
     def clicked(self, figures):
         if self.point_circle_graph_id in figures or self.entry_track.get_graph_id() in figures or self.normal_track.get_graph_id() in figures or self.reverse_track.get_graph_id() in figures:
             self.toggle()
 
+    def add_clickable(self, index):
+        index.add_circle(self.location, 10, self)
+        for track in (self.entry_track, self.normal_track, self.reverse_track):
+            index.add_segment(track.get_start_location(), track.get_end_location(), self, TRACK_WIDTH)
+
+    def add_topology(self, topology):
+        topology.add_turnout(self, self.location, self.entry_location, self.normal_location, self.reverse_location)
+
     def erase(self):
         self.entry_track.erase()
         self.normal_track.erase()
         self.reverse_track.erase()
         if self.panel:
-            self.panel.delete_figure(self.point_circle)
+            _canvas_updates.erased(self.panel, self.point_circle_graph_id)
+            self.panel.delete_figure(self.point_circle_graph_id)
 
 class Block:
     class _Iterator:
@@ -598,24 +1317,40 @@ class Block:
         else:
             self.label_color = label_color
         self.items = []
+        # Every item in the block and in the blocks within it by id, kept up to date
+        # as items are added so that finding an item doesn't need a search
+        self.index = {}
+        self.parent = None
         self.panel = None
 
     def __iter__(self):
         return self._Iterator(self.items)
 
     def __getitem__(self, key):
-        print('__getitem__() key:', key)
         return self.find_element(key)
 
     def find_element(self, key):
-        for item in self.items:
-            if item.id == key:
-                return item
-        raise KeyError(key)
+        return self.index[key]
+
+    def _register(self, entries):
+        # The ids are checked all of the way up before anything is changed so a
+        # duplicate id leaves every index as it was
+        for id in entries:
+            if id in self.index:
+                raise ValueError(f'Duplicate id \'{id}\' in block \'{self.id}\', every item must have a different id')
+        if self.parent:
+            self.parent._register(entries)
+        self.index.update(entries)
 
     def add(self, item):
         if isinstance(item, (Block, Track, Stub, Turnout, Signal)):
+            entries = {item.id: item}
+            if isinstance(item, Block):
+                entries.update(item.index)
+            self._register(entries)
             self.items.append(item)
+            if isinstance(item, Block):
+                item.parent = self
         else:
             raise TypeError(f'Attempt to add a \'{type(item).__name__}\' to a block. Valid types are Block, Track, Stub, Turnout or Signal. Revise your code so that one of the correct types is added')
 
@@ -634,12 +1369,20 @@ class Block:
         for item in self.items:
             item.clicked(figures)
 
+    def add_clickable(self, index):
+        for item in self.items:
+            item.add_clickable(index)
+
+    def add_topology(self, topology):
+        for item in self.items:
+            item.add_topology(topology)
+
     def erase(self):
         for item in self.items:
             item.erase()
 
 class Layout:
-    def __init__(self, label, label_font_size = 30, label_color = None, background_color = None, height = 300, width = 1200, clickable_panel = True, item_buttons = True, route_buttons = True, exit_button = True, informers = False, responders = False):
+    def __init__(self, label, label_font_size = 30, label_color = None, background_color = None, height = 300, width = 1200, clickable_panel = True, item_buttons = True, route_buttons = True, exit_button = True, informers = False, responders = False, interlocking = False):
         self.label = label
         self.label_font_size = label_font_size
         if label_color is None:
@@ -658,17 +1401,52 @@ class Layout:
         self.clickable_panel = clickable_panel
         self.blocks = []
         self.routes = []
+        self.route_index = {}
+        # Every item in the layout, however deep in blocks, by id
+        self.index = {}
         self.panel = None
+        # With an interlocking a route can't be set while a route that needs any of
+        # the same items is set, and items in a set route can't be changed by hand
+        if interlocking:
+            self.interlocking = Interlocking()
+        else:
+            self.interlocking = None
+        # Built from the ends of the items the first time a path is asked for
+        self.topology = None
+
+    def _register(self, entries):
+        for id in entries:
+            if id in self.index:
+                raise ValueError(f'Duplicate id \'{id}\' in layout \'{self.label}\', every item must have a different id')
+        self.index.update(entries)
+        for item in entries.values():
+            self._take_push_button(item)
+        # Anything added may change what is connected to what
+        self.topology = None
 
     def add_block(self, block):
         if isinstance(block, (Block, Track, Stub, Turnout, Signal)):
+            entries = {block.id: block}
+            if isinstance(block, Block):
+                entries.update(block.index)
+            self._register(entries)
             self.blocks.append(block)
+            if isinstance(block, Block):
+                block.parent = self
         else:
             raise TypeError(f'Attempt to add a \'{type(block).__name__}\' to the block list. Valid types are Block, Track, Stub, Turnout or Signal. Revise your code so that one of the correct types is added')
 
     def add_route(self, route):
         if isinstance(route, Route):
+            if route.id in self.route_index:
+                raise ValueError(f'Duplicate route id \'{route.id}\' in layout \'{self.label}\', every route must have a different id')
+            plan = route.compile()
+            if self.interlocking:
+                self.interlocking.add(route, plan.legs)
+                route.interlocking = self.interlocking
+            self._take_push_button(route)
             self.routes.append(route)
+            self.route_index[route.id] = route
         else:
             raise TypeError(f'Attempt to add a \'{type(route).__name__}\' to the Route list, revise your code so that the correct type is added')
 
@@ -693,8 +1471,15 @@ class Layout:
             if isinstance(block, Block):
                 Layout._make_block_keyboard_events(block, events)
             elif (isinstance(block, Turnout) or isinstance(block, Signal)) and block.keyboard_event:
-                events[block.keyboard_event] = block.toggle
+                events[block.keyboard_event] = block
     
+    def _supervised_items(blocks, items):
+        for block in blocks:
+            if isinstance(block, Block):
+                Layout._supervised_items(block, items)
+            elif (isinstance(block, Turnout) or isinstance(block, Signal)) and block.supervisor:
+                items.append(block)
+
     def _update_supervisors(blocks):
         for block in blocks:
             if isinstance(block, Block):
@@ -702,43 +1487,152 @@ class Layout:
             elif isinstance(block, Turnout) or isinstance(block, Signal):
                 block.set_supervisor_state()
 
-    def run(self, initial_route = None, full_screen = True, headless = False, enable_keyboard = False, close_all_supervisors = True):
+    def find_path(self, start, end):
+        # The turnout settings, a list of (turnout, position), that connect two items
+        # by the shortest path, or None if there isn't one. start and end are items
+        # or their ids, usually tracks or stubs. A path to or from a turnout is taken
+        # from its entry so the turnout's own setting is part of the path
+        if self.topology is None:
+            self.topology = Topology()
+            for block in self.blocks:
+                block.add_topology(self.topology)
+        if not isinstance(start, (Track, Stub, Turnout)):
+            start = self.index[start]
+        if not isinstance(end, (Track, Stub, Turnout)):
+            end = self.index[end]
+        return self.topology.path(start, end)
+
+    def set_path(self, start, end):
+        # Set the turnouts for the path between two items, returns the settings or None
+        # if there is no path or a turnout on it is part of a set route
+        legs = self.find_path(start, end)
+        if legs is None:
+            return None
+        if self.interlocking and any(self.interlocking.item_locked(leg) for leg, does in legs):
+            return None
+        RoutePlan(legs).run()
+        return legs
+
+    def _take_push_button(self, item):
+        # A push button that toggles its item is pointed at the layout instead so
+        # that presses are checked against the interlocking like clicks and keys
+        push_button = getattr(item, 'push_button', None)
+        if isinstance(push_button, PushButton) and push_button.callback == item.toggle:
+            push_button.callback = partial(self._toggle, item)
+            push_button.toggles = Layout._toggles(item)
+
+    @staticmethod
+    def _toggles(item):
+        # A route without an interlocking is set by every press, so presses of it
+        # don't cancel each other out
+        return not isinstance(item, Route) or item.interlocking is not None
+
+    def _press(self, item):
+        _inputs.press(item, partial(self._toggle, item), toggles = Layout._toggles(item))
+
+    def _toggle(self, item):
+        # Routes, turnouts and signals, items that are part of a set route are left alone
+        if isinstance(item, Route):
+            if not item.toggle():
+                conflicts = 'Route ' + item.id + ' conflicts with ' + ', '.join(route.id for route in item.interlocking.conflicts_with(item))
+                if _dispatcher:
+                    sg.popup_error(conflicts, title = 'Route not set')
+                else:
+                    print(conflicts)
+        elif not (self.interlocking and self.interlocking.item_locked(item)):
+            item.toggle()
+
+    def _control_command(self, command, loop):
+        # A command from the control socket, verb:id or path:start:end, returns ok or error
+        parts = command.split(':')
+        verb = parts[0]
+        if verb == 'quit' and len(parts) == 1:
+            loop.stop()
+            return 'ok'
+        if verb == 'path' and len(parts) == 3:
+            if parts[1] in self.index and parts[2] in self.index and self.set_path(parts[1], parts[2]) is not None:
+                return 'ok'
+            return 'error'
+        if len(parts) != 2:
+            return 'error'
+        if verb in ('route', 'release'):
+            route = self.route_index.get(parts[1])
+            if route is None:
+                return 'error'
+            if verb == 'release':
+                if not route.release():
+                    return 'error'
+            elif not route.run():
+                return 'error'
+            return 'ok'
+        item = self.index.get(parts[1])
+        if not isinstance(item, (Turnout, Signal)):
+            return 'error'
+        if self.interlocking and self.interlocking.item_locked(item):
+            return 'error'
+        if verb == 'toggle':
+            item.toggle()
+        elif verb in item.SUPERVISOR_POSITIONS:
+            getattr(item, verb)()
+        else:
+            return 'error'
+        return 'ok'
+
+    def run(self, initial_route = None, full_screen = True, headless = False, enable_keyboard = False, close_all_supervisors = True, control = None, trace = None):
+        # trace is a file to write the spans of every route and item request to as
+        # Chrome trace events once the layout stops running
+        global _tracer
+        if trace:
+            _tracer = Tracing.Tracer('panel ' + self.label, trace)
+        try:
+            self._run(initial_route, full_screen, headless, enable_keyboard, close_all_supervisors, control)
+        finally:
+            if _tracer:
+                _tracer.export()
+                _tracer = None
+
+    def _run(self, initial_route, full_screen, headless, enable_keyboard, close_all_supervisors, control):
         keyboard_events = {}
+        _inputs.debounce = INPUT_DEBOUNCE
+        _inputs.window = INPUT_COALESCE_WINDOW
+
+        supervised = []
+        Layout._supervised_items(self.blocks, supervised)
+        for route in self.routes:
+            Layout._supervised_items([leg for leg, does in route.legs], supervised)
+        _check_supervisors(set(supervised))
         
         if enable_keyboard:
             Layout._make_block_keyboard_events(self.blocks, keyboard_events)
             for route in self.routes:
                 if route.keyboard_event:
-                    keyboard_events[route.keyboard_event] = route.run
+                    keyboard_events[route.keyboard_event] = route
 
         if headless:
+            # At this stage everything is ready so make sure all supervisors are in step,
+            # this is done before the initial route so that the route is set after it
+            Layout._update_supervisors(self.blocks)
+
             # initial_route can be either a Route or a string ID of a route
             if initial_route:
                 if isinstance(initial_route, Route):
                     initial_route.run()
-                else:
-                    for route in self.routes:
-                        if route.id == initial_route:
-                            route.run()
-                            break
-            
-            # At this stage everything is ready so make sure all supervisors are in step
-            Layout._update_supervisors(self.blocks)
+                elif initial_route in self.route_index:
+                    self.route_index[initial_route].run()
 
-            # Need to pause here so that push buttons and whatever else can be processed until shutdown
+            # Need to pause here so that push buttons and whatever else can be processed until shutdown,
+            # control is a Unix socket path or a TCP port for scripts to send commands to
             print('Running ' + self.label + ', press enter to quit...')
-            while True:
-                event = getkey()
-                print('event', event)
-                if event == keys.ENTER:
-                    break
-                else:
-                    for keyboard_event in keyboard_events:
-                        if keyboard_event == event:
-                            keyboard_events[keyboard_event]()
-                            break
+            global _headless_loop
+            _headless_loop = _HeadlessLoop(self, keyboard_events, control)
+            try:
+                _headless_loop.run()
+            finally:
+                _headless_loop = None
         else:
-            screen_size = _get_screen_size()
+            # Measured with the hidden root window that the main window is built on
+            # rather than a window of its own
+            screen_size = sg.Window.get_screen_size()
             canvas_size = (screen_size[0] - 100, screen_size[1] - 250)
 
             sg.theme(APPLICATION_THEME)
@@ -769,59 +1663,68 @@ class Layout:
 
             panel = window['panel']
 
+            # From now on supervisors are talked to in the background
+            global _dispatcher
+            _dispatcher = _SupervisorDispatcher(window)
+
             for block in self.blocks:
                 block.set_panel(panel)
 
             for block in self.blocks:
                 block.draw()
 
+            # Clicks on the panel are looked up in a spatial index to go straight to
+            # the item that was clicked
+            clickable = SpatialIndex()
+            for block in self.blocks:
+                block.add_clickable(clickable)
+
+            # At this stage everything is ready to display on the screen, so make sure all supervisors
+            # are in step with what we are about to show. Requests are carried out in the order they
+            # are made, so this comes before the initial route or it would undo what the route sets
+            Layout._update_supervisors(self.blocks)
+
             # initial_route can be either a Route or a string ID of a route
             if initial_route:
                 if isinstance(initial_route, Route):
                     initial_route.run()
-                else:
-                    for route in self.routes:
-                        if route.id == initial_route:
-                            route.run()
-                            break
-            
-            # At this stage everything is ready to display on the screen, so make sure all supervisors
-            # are in step with what we are about to show
-            Layout._update_supervisors(self.blocks)
+                elif initial_route in self.route_index:
+                    self.route_index[initial_route].run()
 
+            # Colour changes made while handling each event are applied together
+            # just before the window is read again
+            _canvas_updates.batching = True
             while True:
-                event, values = window.read()
+                _inputs.run_due()
+                _canvas_updates.flush()
+                # Only wake up without an event when a press is due to be acted on
+                timeout = _inputs.timeout()
+                if timeout is None:
+                    event, values = window.read()
+                else:
+                    event, values = window.read(timeout = int(timeout * 1000))
                 if event == sg.WIN_CLOSED:
                     break
                 if event == 'Exit':
                     break
-                if event == 'panel' and self.clickable_panel:
-                    figures = window['panel'].get_figures_at_location(values['panel'])
-                    if len(figures):
-                        for block in self.blocks:
-                            block.clicked(figures)
+                if event == sg.TIMEOUT_EVENT:
+                    pass
+                elif event == _SupervisorDispatcher.EVENT:
+                    # A supervisor request has finished, show the result
+                    values[event]()
+                elif event == 'panel' and self.clickable_panel:
+                    item = clickable.find(values['panel'])
+                    if item:
+                        self._press(item)
                 else:
                     if event.startswith('+route+'):
-                        route_id = event[7:]
-                        for route in self.routes:
-                            if route.id == route_id:
-                                route.run()
-                                break
+                        route = self.route_index.get(event[7:])
+                        if route:
+                            self._press(route)
                     elif event.startswith('+item+'):
-                        item_id = event[6:]
-                        done = False
-                        for block in self.blocks:
-                            if isinstance(block, Turnout) or isinstance(block, Signal):
-                                if block.id == item_id:
-                                    block.toggle()
-                                    done = True
-                            else:
-                                for item in block:
-                                    if item.id == item_id:
-                                        item.toggle()
-                                        done = True
-                            if done:
-                                break
+                        item = self.index.get(event[6:])
+                        if isinstance(item, Turnout) or isinstance(item, Signal):
+                            self._press(item)
                     else:
                         # On a Raspberry Pi we get event.keysym and event.keycode rather than event.char from
                         # the underlaying tkinter event, this is normalised to a single keyboard character if
@@ -834,22 +1737,26 @@ class Layout:
                             kb_char = ''
                         for keyboard_event in keyboard_events:
                             if keyboard_event == kb_char:
-                                keyboard_events[keyboard_event]()
+                                self._press(keyboard_events[keyboard_event])
                                 break
+            _dispatcher.shutdown()
+            _dispatcher = None
+            _canvas_updates.batching = False
+            _canvas_updates.dirty = {}
             window.close()
 
         if close_all_supervisors:
             for supervisor in _supervisors:
-                nw0.send_message_to(_supervisors[supervisor], 'shutdown')
+                try:
+                    _supervisor_message(supervisor, 'shutdown')
+                except RuntimeError as error:
+                    print(error)
 
     def __getitem__(self, key):
         return self.find_element(key)
 
     def find_element(self, key):
-        for block in self.blocks:
-            if block.id == key:
-                return block
-        raise KeyError(key)
+        return self.index[key]
 
     def draw(self):
         for block in self.blocks:
@@ -860,7 +1767,7 @@ def Main():
 
 #    set_default('LAYOUT_BACKGROUND_COLOR', 'black')
 
-    west_entry_track = Track('West Entry', (25, 200), (75, 200))
+    west_entry_track = Track('West Entry', (25, 200), (50, 200))
     starter_signal = Signal('Starter', (75, 225))
     west_turnout = Turnout('West Turnout', location = (150, 200))
 
@@ -0,0 +1,144 @@
+import math
+import numpy as np
+
+# A profile says how a servo gets from where it is to where it is sent. Each move
+# is compiled once into a timeline, a table of positions at equal steps of time,
+# so that moving a servo on a tick is an index into the table and an interpolation
+# between two entries. Profiles are shared by every servo with the same settings,
+# as are the timelines they compile, so turnouts that move between the same
+# positions at the same speed all use one table
+STEP = 0.005 # Seconds between the entries of a timeline
+MAX_TIMELINES = 64 # Timelines kept by each profile
+
+class Timeline:
+    __slots__ = ('table', 'step', 'duration')
+
+    def __init__(self, table, step):
+        self.table = table
+        self.step = step
+        self.duration = step * (len(table) - 1)
+
+class Profile:
+    # Moves at up_speed when the position is increasing and down_speed when it is
+    # decreasing, both in degrees per second. Passing through a number of targets
+    # is a segment for each one
+    def __init__(self, up_speed, down_speed):
+        self.up_speed = abs(up_speed)
+        self.down_speed = abs(down_speed)
+        self.timelines = {}
+
+    def keyframes(self, start, targets):
+        # The positions passed through from start to the last of the targets
+        return (start,) + tuple(targets)
+
+    def timeline(self, start, targets):
+        # Returns None if there is nothing to do
+        key = (start, targets)
+        timeline = self.timelines.get(key)
+        if timeline is None:
+            timeline = self.compile(start, targets)
+            if len(self.timelines) >= MAX_TIMELINES:
+                self.timelines.clear()
+            self.timelines[key] = timeline
+        return timeline
+
+    def compile(self, start, targets):
+        segments = []
+        keyframes = self.keyframes(start, targets)
+        for begin, end in zip(keyframes, keyframes[1:]):
+            if end != begin:
+                speed = self.up_speed if end > begin else self.down_speed
+                segments.append((begin, end, speed, self.duration(abs(end - begin), speed)))
+        total = sum(segment[3] for segment in segments)
+        if total <= 0.0:
+            return None
+        # The step is shortened a little so that the last entry is exactly at the end
+        steps = max(1, math.ceil(total / STEP))
+        step = total / steps
+        times = np.arange(steps + 1) * step
+        table = np.empty(steps + 1)
+        table[:] = keyframes[-1]
+        elapsed = 0.0
+        for begin, end, speed, duration in segments:
+            within = (times >= elapsed) & (times < elapsed + duration)
+            travelled = self.travelled(times[within] - elapsed, abs(end - begin), speed, duration)
+            table[within] = begin + math.copysign(1.0, end - begin) * travelled
+            elapsed += duration
+        return Timeline(table, step)
+
+    def duration(self, distance, speed):
+        return distance / speed
+
+    def travelled(self, t, distance, speed, duration):
+        # The distance covered t seconds into a segment, t is an array
+        return speed * t
+
+class Linear(Profile):
+    pass
+
+class Trapezoidal(Profile):
+    # Speeds up at acceleration degrees per second per second to the speed of the
+    # segment, and slows down again at the same rate. A segment too short to reach
+    # full speed starts slowing down half way
+    def __init__(self, up_speed, down_speed, acceleration):
+        super().__init__(up_speed, down_speed)
+        self.acceleration = acceleration
+
+    def ramp(self, distance, speed):
+        # Returns the time taken to reach the top speed and the top speed
+        if distance >= speed * speed / self.acceleration:
+            return speed / self.acceleration, speed
+        ramp_time = math.sqrt(distance / self.acceleration)
+        return ramp_time, self.acceleration * ramp_time
+
+    def duration(self, distance, speed):
+        ramp_time, top_speed = self.ramp(distance, speed)
+        return 2 * ramp_time + (distance - top_speed * ramp_time) / top_speed
+
+    def ramped(self, t, ramp_time, top_speed):
+        # The distance covered t seconds into speeding up
+        return 0.5 * top_speed / ramp_time * t * t
+
+    def travelled(self, t, distance, speed, duration):
+        ramp_time, top_speed = self.ramp(distance, speed)
+        return np.where(t < ramp_time, self.ramped(t, ramp_time, top_speed),
+                        np.where(t > duration - ramp_time, distance - self.ramped(np.maximum(duration - t, 0.0), ramp_time, top_speed),
+                                 0.5 * top_speed * ramp_time + top_speed * (t - ramp_time)))
+
+class SCurve(Trapezoidal):
+    # As trapezoidal and taking the same time, but the acceleration rises and falls
+    # smoothly rather than being switched on and off so the servo doesn't jerk
+    def ramped(self, t, ramp_time, top_speed):
+        return 0.5 * top_speed * (t - ramp_time / math.pi * np.sin(math.pi * t / ramp_time))
+
+class Bounce(Profile):
+    # After reaching the last target the servo springs back and returns to it a
+    # number of times. The first rebound is bounces * rebound degrees and each
+    # one after it is rebound degrees less, a negative rebound springs back down
+    def __init__(self, up_speed, down_speed, bounces, rebound):
+        super().__init__(up_speed, down_speed)
+        self.bounces = bounces
+        self.rebound = rebound
+
+    def keyframes(self, start, targets):
+        end = targets[-1]
+        keyframes = (start,) + tuple(targets)
+        for ndx in range(self.bounces):
+            keyframes += (end + self.rebound * (self.bounces - ndx), end)
+        return keyframes
+
+PROFILES = {'linear': Linear, 'trapezoidal': Trapezoidal, 's-curve': SCurve, 'bounce': Bounce}
+
+_shared = {}
+
+def shared(kind, *parameters):
+    # The one profile of a kind with these parameters
+    if isinstance(kind, str):
+        if kind not in PROFILES:
+            raise ValueError(f'Invalid motion profile \'{kind}\', valid profiles are ' + ', '.join(PROFILES))
+        kind = PROFILES[kind]
+    key = (kind,) + parameters
+    profile = _shared.get(key)
+    if profile is None:
+        profile = _shared[key] = kind(*parameters)
+    return profile
@@ -0,0 +1,151 @@
+import threading
+from time import sleep
+
+# A PCA9685 driven directly rather than through ServoKit. ServoKit writes each
+# channel as it is set, an I2C transaction per servo per tick. Here the servos
+# only note their new pulse and the board sends every channel that has changed in
+# a single auto-increment write when it is flushed, once per tick
+MODE1 = 0x00
+PRESCALE = 0xFE
+LED0_ON_L = 0x06
+MODE1_RESTART = 0x80
+MODE1_AUTO_INCREMENT = 0x20
+MODE1_SLEEP = 0x10
+REFERENCE_CLOCK = 25000000 # Hz
+CHANNELS = 16
+
+class FakeI2C:
+    # An I2C bus in memory that keeps the registers of every device written to and
+    # counts the transactions and bytes, so the writes can be checked and measured
+    # without any hardware
+    def __init__(self, bus_id = None):
+        self.bus_id = bus_id
+        self.registers = {}
+        self.transactions = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def try_lock(self):
+        return self.lock.acquire(blocking = False)
+
+    def unlock(self):
+        self.lock.release()
+
+    def writeto(self, address, buffer, *, start = 0, end = None):
+        data = bytes(buffer[start:end])
+        self.transactions += 1
+        self.bytes += len(data)
+        registers = self.registers.setdefault(address, bytearray(256))
+        # The first byte is the register and the rest are written from there on,
+        # as they are with auto-increment
+        register = data[0]
+        for value in data[1:]:
+            registers[register] = value
+            register = (register + 1) % 256
+
+    def stats(self):
+        return {'transactions': self.transactions, 'bytes': self.bytes}
+
+class PCA9685Board:
+    def __init__(self, i2c, address = 0x40, frequency = 50, block_writes = True):
+        # With block_writes False every changed channel is written on its own, the
+        # same as ServoKit does, which is only of use for comparison
+        self.i2c = i2c
+        self.address = address
+        self.frequency = frequency
+        self.block_writes = block_writes
+        self.lock = threading.Lock()
+        # ON_L, ON_H, OFF_L, OFF_H for each channel as last sent and as wanted next
+        self.sent = bytearray(4 * CHANNELS)
+        self.wanted = bytearray(4 * CHANNELS)
+        self.low = CHANNELS
+        self.high = -1
+        prescale = max(3, int(REFERENCE_CLOCK / 4096.0 / frequency + 0.5) - 1)
+        self._write(bytes((MODE1, MODE1_SLEEP)))
+        self._write(bytes((PRESCALE, prescale)))
+        self._write(bytes((MODE1, MODE1_AUTO_INCREMENT)))
+        sleep(0.005)
+        self._write(bytes((MODE1, MODE1_AUTO_INCREMENT | MODE1_RESTART)))
+
+    def _write(self, data):
+        while not self.i2c.try_lock():
+            pass
+        try:
+            self.i2c.writeto(self.address, data)
+        finally:
+            self.i2c.unlock()
+
+    def set_duty_cycle(self, channel, duty_cycle):
+        # A 16 bit duty cycle as adafruit_pca9685 takes it, the board keeps 12 bits
+        # rounded the same way as adafruit_pca9685 and ServoEngine._pulses so that
+        # both backends write the same count
+        if duty_cycle == 0xFFFF:
+            on, off = 0x1000, 0 # Fully on
+        elif duty_cycle < 0x0010:
+            on, off = 0, 0x1000 # Fully off
+        else:
+            on, off = 0, (duty_cycle + 1) >> 4
+        offset = 4 * channel
+        with self.lock:
+            self.wanted[offset:offset + 4] = bytes((on & 0xFF, on >> 8, off & 0xFF, off >> 8))
+            if self.wanted[offset:offset + 4] != self.sent[offset:offset + 4]:
+                self.low = min(self.low, channel)
+                self.high = max(self.high, channel)
+
+    def flush(self):
+        # Send the channels that have changed since the last flush, returns the number
+        # of I2C transactions used
+        with self.lock:
+            if self.high < self.low:
+                return 0
+            low, high = self.low, self.high
+            self.low = CHANNELS
+            self.high = -1
+            wanted = bytes(self.wanted[4 * low:4 * (high + 1)])
+            sent = bytes(self.sent[4 * low:4 * (high + 1)])
+            self.sent[4 * low:4 * (high + 1)] = wanted
+        if self.block_writes:
+            # Channels between the first and last that changed are sent again as they
+            # are, one transaction of a few more bytes beats a transaction each
+            self._write(bytes((LED0_ON_L + 4 * low,)) + wanted)
+            return 1
+        transactions = 0
+        for channel in range(high - low + 1):
+            offset = 4 * channel
+            if wanted[offset:offset + 4] != sent[offset:offset + 4]:
+                self._write(bytes((LED0_ON_L + 4 * (low + channel),)) + wanted[offset:offset + 4])
+                transactions += 1
+        return transactions
+
+class PCA9685Servo:
+    # A servo on a channel of a PCA9685Board, the angle is turned into a duty cycle
+    # in the same way as adafruit_motor so the pulses are the same as with ServoKit
+    def __init__(self, board, channel, actuation_range = 180, min_pulse = 750, max_pulse = 2250):
+        self.board = board
+        self.channel = channel
+        self.actuation_range = actuation_range
+        self._min_duty = int((min_pulse * board.frequency) / 1000000 * 0xFFFF)
+        max_duty = (max_pulse * board.frequency) / 1000000 * 0xFFFF
+        self._duty_range = int(max_duty - self._min_duty)
+        self._angle = None
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, angle):
+        if angle is None:
+            # Stop sending pulses
+            self.board.set_duty_cycle(self.channel, 0)
+        else:
+            if angle < 0 or angle > self.actuation_range:
+                raise ValueError('Angle out of range')
+            self.board.set_duty_cycle(self.channel, self._min_duty + int(angle / self.actuation_range * self._duty_range))
+        self._angle = angle
+
+class PCA9685Kit:
+    # Enough like ServoKit for the Supervisor, a board and a servo on each channel
+    def __init__(self, i2c, address = 0x40, frequency = 50, block_writes = True):
+        self.board = PCA9685Board(i2c, address, frequency, block_writes)
+        self.servo = [PCA9685Servo(self.board, channel) for channel in range(CHANNELS)]
@@ -0,0 +1,223 @@
+import numpy as np
+from time import monotonic as ticks_ms
+from . import MotionProfile
+
+# The PCA9685 used by ServoKit has a 12 bit PWM output so many angles close to each
+# other produce the same pulse. These are the defaults used by adafruit_motor to
+# convert an angle to a duty cycle, the values from the servo itself are used when
+# it has them
+SERVO_MIN_PULSE = 750 # Microseconds
+SERVO_MAX_PULSE = 2250 # Microseconds
+SERVO_ACTUATION_RANGE = 180 # Degrees
+PWM_FREQUENCY = 50 # Hz
+
+class ServoEngine:
+    # The state of every servo is held in arrays so that all of the moving servos
+    # can be advanced with a handful of array operations per tick rather than a
+    # Python method call per servo. Turnouts and Signals keep only their settings
+    # and refer to their servo by its index into the arrays
+    INITIAL_CAPACITY = 16
+    INITIAL_POOL = 4096
+
+    def __init__(self, capacity = INITIAL_CAPACITY):
+        self.count = 0
+        self.servos = []
+        self.profiles = []
+        self.position = np.zeros(capacity)
+        self.target = np.zeros(capacity)
+        self.start_time = np.zeros(capacity)
+        self.active = np.zeros(capacity, dtype = bool)
+        self.offset = np.zeros(capacity)
+        self.sign = np.ones(capacity)
+        # Each movement follows a timeline compiled by a motion profile. The tables
+        # of the timelines are copied into one pool so that every moving servo can
+        # be looked up at once, each servo has the start of its table in the pool,
+        # the index of the last entry and the time between entries
+        self.pool = np.zeros(ServoEngine.INITIAL_POOL)
+        self.pool_used = 0
+        self.pooled = {} # Timeline to the start of its table in the pool
+        self.timelines = [] # The timeline each servo is following
+        self.table_start = np.zeros(capacity, dtype = np.int64)
+        self.table_last = np.zeros(capacity, dtype = np.int64)
+        self.table_step = np.ones(capacity)
+        # The last pulse sent to each servo so that writes that would not change
+        # the output can be skipped
+        self.min_duty = np.zeros(capacity)
+        self.duty_range = np.zeros(capacity)
+        self.actuation_range = np.ones(capacity)
+        self.pulse = np.full(capacity, -1, dtype = np.int64)
+        self.writes_issued = 0
+        self.writes_suppressed = 0
+        # Indexes of the servos that have reached the end of their movement since
+        # completed was last taken
+        self.completed = []
+
+    def _grow(self, capacity):
+        def grow(array):
+            grown = np.zeros((capacity,) + array.shape[1:], dtype = array.dtype)
+            grown[:len(array)] = array
+            return grown
+        self.position = grow(self.position)
+        self.target = grow(self.target)
+        self.start_time = grow(self.start_time)
+        self.active = grow(self.active)
+        self.offset = grow(self.offset)
+        self.sign = grow(self.sign)
+        self.table_start = grow(self.table_start)
+        self.table_last = grow(self.table_last)
+        self.table_step = grow(self.table_step)
+        self.min_duty = grow(self.min_duty)
+        self.duty_range = grow(self.duty_range)
+        self.actuation_range = grow(self.actuation_range)
+        self.pulse = grow(self.pulse)
+
+    def add(self, servo, position, up_speed, down_speed, offset = 0.0, invert = False, profile = None):
+        # The angle written to the servo is offset + position, or offset - position
+        # if the servo is inverted. The profile is used for every move that isn't
+        # given one of its own, by default the servo moves at a constant up_speed or
+        # down_speed
+        if self.count == len(self.position):
+            self._grow(self.count * 2)
+        ndx = self.count
+        self.count += 1
+        self.servos.append(servo)
+        if profile is None:
+            profile = MotionProfile.shared(MotionProfile.Linear, up_speed, down_speed)
+        self.profiles.append(profile)
+        self.timelines.append(None)
+        self.position[ndx] = position
+        self.target[ndx] = position
+        self.offset[ndx] = offset
+        self.sign[ndx] = -1.0 if invert else 1.0
+        min_duty = int((SERVO_MIN_PULSE * PWM_FREQUENCY) / 1000000 * 0xFFFF)
+        max_duty = (SERVO_MAX_PULSE * PWM_FREQUENCY) / 1000000 * 0xFFFF
+        self.min_duty[ndx] = getattr(servo, '_min_duty', min_duty)
+        self.duty_range[ndx] = getattr(servo, '_duty_range', int(max_duty - min_duty))
+        self.actuation_range[ndx] = getattr(servo, 'actuation_range', SERVO_ACTUATION_RANGE)
+        angle = float(self.offset[ndx] + self.sign[ndx] * position)
+        self.pulse[ndx] = self._pulses(np.array([ndx]), np.array([angle]))[0]
+        servo.angle = angle
+        self.writes_issued += 1
+        return ndx
+
+    def _pulses(self, ndxs, angles):
+        # The same sums as adafruit_motor and the PCA9685 driver, the duty cycle is
+        # 16 bits and the PCA9685 keeps the top 12 of them
+        duty = self.min_duty[ndxs] + np.trunc(angles / self.actuation_range[ndxs] * self.duty_range[ndxs])
+        return (duty.astype(np.int64) + 1) >> 4
+
+    def write_stats(self):
+        return {'writes_issued': self.writes_issued, 'writes_suppressed': self.writes_suppressed}
+
+    def move(self, ndx, targets, now = None, profile = None):
+        # The servo passes through each of the targets in turn, following the
+        # profile given or else the one it was added with
+        if profile is None:
+            profile = self.profiles[ndx]
+        # A servo that is standing still where it is sent doesn't move at all, not
+        # even to bounce
+        if not self.active[ndx] and self.position[ndx] == targets[-1]:
+            timeline = None
+        else:
+            timeline = profile.timeline(float(self.position[ndx]), tuple(float(target) for target in targets))
+        self.target[ndx] = targets[-1]
+        if timeline is None:
+            # Already there, so the movement is complete straight away
+            self.active[ndx] = False
+            self.timelines[ndx] = None
+            self.completed.append(ndx)
+            return
+        if now is None:
+            now = ticks_ms()
+        self.table_start[ndx] = self._place(timeline)
+        self.table_last[ndx] = len(timeline.table) - 1
+        self.table_step[ndx] = timeline.step
+        self.timelines[ndx] = timeline
+        self.start_time[ndx] = now
+        self.active[ndx] = True
+
+    def _place(self, timeline):
+        # Returns where the table of the timeline starts in the pool, copying it in
+        # if it isn't there already
+        start = self.pooled.get(timeline)
+        if start is None:
+            size = len(timeline.table)
+            if self.pool_used + size > len(self.pool):
+                self._compact(size)
+            start = self.pool_used
+            self.pool[start:start + size] = timeline.table
+            self.pool_used += size
+            self.pooled[timeline] = start
+        return start
+
+    def _compact(self, needed):
+        # Start the pool again with only the tables of the servos that are moving,
+        # making it bigger if it is more than half full
+        moving = {}
+        for ndx in np.flatnonzero(self.active[:self.count]).tolist():
+            moving.setdefault(self.timelines[ndx], []).append(ndx)
+        used = sum(len(timeline.table) for timeline in moving) + needed
+        capacity = len(self.pool)
+        while capacity < used * 2:
+            capacity *= 2
+        self.pool = np.zeros(capacity)
+        self.pool_used = 0
+        self.pooled = {}
+        for timeline, ndxs in moving.items():
+            self.table_start[ndxs] = self._place(timeline)
+
+    def is_active(self, ndx):
+        return bool(self.active[ndx])
+
+    def progress(self, ndx, now = None):
+        # How far through its movement a servo is, from 0.0 to 1.0, by time
+        if not self.active[ndx]:
+            return 1.0
+        if now is None:
+            now = ticks_ms()
+        duration = self.table_last[ndx] * self.table_step[ndx]
+        return float(min(1.0, (now - self.start_time[ndx]) / duration))
+
+    def take_completed(self):
+        completed, self.completed = self.completed, []
+        return completed
+
+    def active_count(self):
+        return int(np.count_nonzero(self.active[:self.count]))
+
+    def tick(self, now = None):
+        # Advance every moving servo and write the new angles, returns the number of
+        # servos that are still moving
+        if now is None:
+            now = ticks_ms()
+        moving = np.flatnonzero(self.active[:self.count])
+        if len(moving) == 0:
+            return 0
+        # Where each servo is in its table, interpolating between the entries either
+        # side of it
+        steps = (now - self.start_time[moving]) / self.table_step[moving]
+        last = self.table_last[moving]
+        reached = steps >= last
+        steps = np.minimum(steps, last)
+        entry = np.minimum(steps.astype(np.int64), last - 1)
+        table = self.table_start[moving] + entry
+        before = self.pool[table]
+        position = before + (steps - entry) * (self.pool[table + 1] - before)
+        self.position[moving] = position
+
+        angle = self.offset[moving] + self.sign[moving] * position
+        pulse = self._pulses(moving, angle)
+        changed = pulse != self.pulse[moving]
+        self.pulse[moving] = pulse
+        written = moving[changed]
+        self.writes_issued += len(written)
+        self.writes_suppressed += len(moving) - len(written)
+        servos = self.servos
+        for ndx, value in zip(written.tolist(), angle[changed].tolist()):
+            servos[ndx].angle = value
+
+        if reached.any():
+            done = moving[reached]
+            self.active[done] = False
+            self.completed.extend(done.tolist())
+        return self.active_count()
@@ -0,0 +1,55 @@
+from math import floor, hypot
+
+class SpatialIndex:
+    # A uniform grid over the panel, each cell lists the shapes that pass through
+    # it so that a click only has to be tested against the few shapes near it
+    # rather than against everything on the layout
+    def __init__(self, cell_size = 25):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cell(self, x, y):
+        return (floor(x / self.cell_size), floor(y / self.cell_size))
+
+    def _add(self, shape, low, high):
+        low_x, low_y = self._cell(low[0], low[1])
+        high_x, high_y = self._cell(high[0], high[1])
+        for x in range(low_x, high_x + 1):
+            for y in range(low_y, high_y + 1):
+                self.cells.setdefault((x, y), []).append(shape)
+
+    def add_segment(self, start, end, owner, tolerance):
+        shape = ('segment', start, end, tolerance, owner)
+        self._add(shape,
+                  (min(start[0], end[0]) - tolerance, min(start[1], end[1]) - tolerance),
+                  (max(start[0], end[0]) + tolerance, max(start[1], end[1]) + tolerance))
+
+    def add_circle(self, center, radius, owner):
+        shape = ('circle', center, radius, owner)
+        self._add(shape, (center[0] - radius, center[1] - radius), (center[0] + radius, center[1] + radius))
+
+    def _distance_to_segment(self, location, start, end):
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        length = dx * dx + dy * dy
+        if length == 0:
+            return hypot(location[0] - start[0], location[1] - start[1])
+        t = ((location[0] - start[0]) * dx + (location[1] - start[1]) * dy) / length
+        t = max(0.0, min(1.0, t))
+        return hypot(location[0] - (start[0] + t * dx), location[1] - (start[1] + t * dy))
+
+    def find(self, location):
+        # The owner of the closest shape that the location is within, or None
+        found = None
+        closest = None
+        for shape in self.cells.get(self._cell(location[0], location[1]), ()):
+            if shape[0] == 'segment':
+                distance = self._distance_to_segment(location, shape[1], shape[2])
+                hit = distance <= shape[3]
+            else:
+                distance = hypot(location[0] - shape[1][0], location[1] - shape[1][1])
+                hit = distance <= shape[2]
+            if hit and (closest is None or distance < closest):
+                closest = distance
+                found = shape[-1]
+        return found
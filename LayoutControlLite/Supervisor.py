@@ -1,5 +1,12 @@
 import networkzero as nw0
-from time import sleep, time as ticks_ms
+import threading
+import queue
+from time import sleep, monotonic as ticks_ms
+from .ServoEngine import ServoEngine
+from . import MotionProfile
+from . import WireProtocol
+from .PCA9685 import PCA9685Kit, FakeI2C
+from . import Tracing
 # Raspberry Pi: pip install adafruit-circuitpython-servokit
 try:
     from adafruit_servokit import ServoKit
@@ -10,17 +17,68 @@ except:
             self.angle = 0
 
     class ServoKit:
-        def __init__(self, channels = 16):
-            print('Pseudo ServoKit:', channels, 'channels')
+        def __init__(self, channels = 16, i2c = None, address = 0x40):
+            print('Pseudo ServoKit:', channels, 'channels at address', hex(address))
             self.channels = channels
             self.servo = []
             for ndx in range(self.channels):
                 self.servo.append(Servo(ndx))
+# Boards on I2C buses other than the default: pip install adafruit-extended-bus
+try:
+    from adafruit_extended_bus import ExtendedI2C
+except:
+    class ExtendedI2C:
+        def __init__(self, bus_id):
+            print('Pseudo I2C bus', bus_id)
+            self.bus_id = bus_id
+
+def default_i2c():
+    # The default I2C bus for boards driven without ServoKit: pip install adafruit-blinka
+    try:
+        import board
+        return board.I2C()
+    except:
+        print('Pseudo I2C bus, default')
+        return FakeI2C()
+
+class LatencyHistogram:
+    # Counts of durations in buckets that double in size, bucket n holds durations
+    # of less than 2**n microseconds, so recording one is a few integer operations
+    BUCKETS = 24
+
+    def __init__(self):
+        self.counts = [0] * (LatencyHistogram.BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        self.counts[min(int(duration * 1000000).bit_length(), LatencyHistogram.BUCKETS)] += 1
+
+    def snapshot(self):
+        # Only the buckets that have something in them, keyed by their upper limit in
+        # microseconds, the last bucket has no upper limit
+        buckets = {}
+        for ndx, count in enumerate(self.counts):
+            if count:
+                buckets['inf' if ndx == LatencyHistogram.BUCKETS else str(1 << ndx)] = count
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max,
+                'buckets_us': buckets}
 
 class Turnout:
     MAX_THROW = 45
     
-    def __init__(self, id, channel, left_max = 35, right_max = 35, move_speed = 30, set_to = 'c', invert = False):
+    PROFILES = ('linear', 'trapezoidal', 's-curve')
+
+    def __init__(self, id, channel, left_max = 35, right_max = 35, move_speed = 30, set_to = 'c', invert = False, profile = 'linear', acceleration = 60):
+        # profile is how the points move, at a constant speed or speeding up and
+        # slowing down at acceleration degrees per second per second
         self.id = id
         self.channel = channel
         self.servo = None
@@ -39,30 +97,37 @@ class Turnout:
             self.right_max = right_max
         
         self.move_speed = move_speed # Degrees per second
+        if profile not in Turnout.PROFILES:
+            raise ValueError(f'Invalid turnout profile \'{profile}\', valid profiles are ' + ', '.join(Turnout.PROFILES))
+        if profile == 'linear':
+            self.profile = MotionProfile.shared(profile, move_speed, move_speed)
+        else:
+            self.profile = MotionProfile.shared(profile, move_speed, move_speed, acceleration)
         
-        self.move_start_ms = 0
-        self.current_position = 0
-        self.start_position = 0
+        # Movement is carried out by the engine of the supervisor the turnout is
+        # added to, until then only the target position is kept
+        self.engine = None
+        self.ndx = None
         self.target_position = 0
+        self.requested_position = ''
         self.init_set_to = set_to
         self.invert = invert
         self.set_target_throw(set_to)
-        self.direction = 0
-
-    def _move_to(self, position):
-        self.current_position = position
-        # If the degree position needs to be inverted because of what the Servo
-        # thinks of as left and right are the opposite of how we want the tracks
-        # from the turnout to run
-        degree = position
-        if self.invert:
-            degree *= -1
-        self.servo.angle = degree + 90.0
-    
-    def initial_position(self):
-        self.current_position = self.target_position
-        self.direction = 0
-        self._move_to(self.current_position)
+
+    def attach(self, engine, servo):
+        # The servo starts at the target position. If the degree position needs to
+        # be inverted because of what the Servo thinks of as left and right are the
+        # opposite of how we want the tracks from the turnout to run then the
+        # engine takes care of it
+        self.servo = servo
+        self.engine = engine
+        self.ndx = engine.add(servo, self.target_position, self.move_speed, self.move_speed, offset = 90.0, invert = self.invert, profile = self.profile)
+
+    @property
+    def current_position(self):
+        if self.engine:
+            return float(self.engine.position[self.ndx])
+        return 0
 
     def throw_left(self):
         self.set_target_throw('l')
@@ -80,13 +145,15 @@ class Turnout:
     # both have an initial 'r' and 'r' also looks a bit like a a set of
     # points with the branch to the right
     def normal(self):
+        self.requested_position = 'normal'
         self.throw_left()
     
     def reverse(self):
+        self.requested_position = 'reverse'
         self.throw_right()
 
     def is_moving_to_target(self):
-        return self.direction != 0
+        return self.engine is not None and self.engine.is_active(self.ndx)
     
     def is_on_target(self):
         return not self.is_moving_to_target()
@@ -97,6 +164,11 @@ class Turnout:
     def is_passive(self):
         return not self.is_active()
 
+    def status(self):
+        if self.is_on_target():
+            return 'set'
+        return 'moving:' + str(int(self.engine.progress(self.ndx) * 100))
+
     def set_target_throw(self, hand):
         h = hand.lower()
         if h == 'r':
@@ -107,31 +179,9 @@ class Turnout:
             self.set_target((self.right_max + self.left_max) / 2.0)
 
     def set_target(self, target):
-        if self.current_position != target:
-            self.start_position = self.current_position
-            self.target_position = target
-            self.move_start_ms = ticks_ms()
-            if self.target_position < self.current_position:
-                self.direction = -1
-            else:
-                self.direction = 1
-
-    def update(self):
-        if self.direction:
-            t = ticks_ms() - self.move_start_ms
-            next_position = self.start_position + (self.move_speed * t * self.direction)
-            if self.direction > 0:
-                if next_position > self.target_position:
-                    next_position = self.target_position
-            else:
-                if next_position < self.target_position:
-                    next_position = self.target_position
-            
-            self._move_to(next_position)
-            
-            if self.target_position == self.current_position:
-                # Reached target so indicate stopping movement by setting direction to zero
-                self.direction = 0
+        self.target_position = target
+        if self.engine:
+            self.engine.move(self.ndx, (target,))
 
 class Signal:
     MAX_DOWN = 90
@@ -171,81 +221,51 @@ class Signal:
         self.lift_speed = lift_speed # Degrees per second
         self.drop_speed = drop_speed
         self.bounce = bounce
-        self.targets = []
-        self.target_ndx = 0
-        self.lift_targets = []
-        self.drop_targets = []
+        # Signals with the same speeds share their profiles, and with them the
+        # movements already worked out
+        self.profile = MotionProfile.shared(MotionProfile.Linear, self.lift_speed, self.drop_speed)
         if self.bounce:
-            for ndx in range(Signal.LIFT_BOUNCES + 1):
-                self.lift_targets.append(self.clear_position)
-                self.lift_targets.append(self.clear_position - (self.lift_speed * (Signal.LIFT_BOUNCES - ndx) / 12.5))
-            for ndx in range(Signal.DROP_BOUNCES + 1):
-                self.drop_targets.append(self.danger_position)
-                self.drop_targets.append(self.danger_position - (self.drop_speed * (Signal.DROP_BOUNCES - ndx) / 25.0))
+            self.lift_profile = MotionProfile.shared(MotionProfile.Bounce, self.lift_speed, self.drop_speed, Signal.LIFT_BOUNCES, -self.lift_speed / 12.5)
+            self.drop_profile = MotionProfile.shared(MotionProfile.Bounce, self.lift_speed, self.drop_speed, Signal.DROP_BOUNCES, -self.drop_speed / 25.0)
         else:
-            self.lift_targets.append(self.clear_position)
-            self.drop_targets.append(self.danger_position)
+            self.lift_profile = self.profile
+            self.drop_profile = self.profile
         
-        self.move_start_ms = 0
-        self.current_position = 0
-        self.start_position = 0
+        # Movement is carried out by the engine of the supervisor the signal is
+        # added to, until then only the target position is kept
+        self.engine = None
+        self.ndx = None
         self.target_position = 0
         self.requested_position = ''
         self.init_set_to = set_to
         self.set_target_position(set_to)
-        self.direction = 0
-    
-    def _move_to(self, position):
-        self.current_position = position
-        self.servo.angle = position
-    
-    def initial_position(self):
-        self.current_position = self.target_position
-        self.direction = 0
-        self._move_to(self.current_position)
+
+    def attach(self, engine, servo):
+        # The servo starts at the target position
+        self.servo = servo
+        self.engine = engine
+        self.ndx = engine.add(servo, self.target_position, abs(self.lift_speed), abs(self.drop_speed), profile = self.profile)
+
+    @property
+    def current_position(self):
+        if self.engine:
+            return float(self.engine.position[self.ndx])
+        return 0
 
     def danger(self):
         self.requested_position = 'danger'
-        self.targets = self.drop_targets
-        self.target_ndx = 0
-        self.set_target(self.targets[self.target_ndx])
+        self.set_targets((self.danger_position,), self.drop_profile)
     
     def clear(self):
         self.requested_position = 'clear'
-        self.targets = self.lift_targets
-        self.target_ndx = 0
-        self.set_target(self.targets[self.target_ndx])
+        self.set_targets((self.clear_position,), self.lift_profile)
 
     def center(self):
         self.requested_position = 'center'
-        self.targets = None
         self.set_target(self.center_position)
 
-    def update(self):
-        if self.direction:
-            t = ticks_ms() - self.move_start_ms
-            if self.direction < 0:
-                next_position = self.start_position + (self.drop_speed * t)
-                if next_position < self.target_position:
-                    next_position = self.target_position
-            else:
-                next_position = self.start_position + (self.lift_speed * t)
-                if next_position > self.target_position:
-                    next_position = self.target_position
-            
-            self._move_to(next_position)
-            
-            if self.target_position == self.current_position:
-                # Reached target, if bouncing then set next bounce target
-                if self.targets and self.target_ndx < len(self.targets) - 1:
-                    self.target_ndx += 1
-                    self.set_target(self.targets[self.target_ndx])
-                else:
-                    # Reached target so indicate stopping movement by setting direction to zero
-                    self.direction = 0
-            
     def is_moving_to_target(self):
-        return self.direction != 0
+        return self.engine is not None and self.engine.is_active(self.ndx)
 
     def is_on_target(self):
         return not self.is_moving_to_target()
@@ -256,6 +276,11 @@ class Signal:
     def is_passive(self):
         return not self.is_active()
 
+    def status(self):
+        if self.is_on_target():
+            return 'set'
+        return 'moving:' + str(int(self.engine.progress(self.ndx) * 100))
+
     def set_target_position(self, flag):
         f = flag.lower()
         if f == 'd':
@@ -266,21 +291,264 @@ class Signal:
             self.set_target(self.center_position)
 
     def set_target(self, target):
-        if self.current_position != target:
-            self.start_position = self.current_position
-            self.target_position = target
-            self.move_start_ms = ticks_ms()
-            if self.target_position < self.current_position:
-                self.direction = -1
-            else:
-                self.direction = 1
+        self.set_targets((target,))
+
+    def set_targets(self, targets, profile = None):
+        # The arm passes through each of the targets in turn
+        self.target_position = targets[-1]
+        if self.engine:
+            self.engine.move(self.ndx, targets, profile = profile)
+
+class BusWriter(threading.Thread):
+    # Each I2C bus has its own writer thread so that a busy bus does not hold up
+    # writes to the servos on the other buses. Only the latest angle for each
+    # servo is kept, if the bus falls behind then angles that have been overtaken
+    # are never written. Boards driven directly are flushed rather than written
+    # to servo by servo
+    def __init__(self, bus):
+        super().__init__(name = 'BusWriter-' + str(bus), daemon = True)
+        self.bus = bus
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {}
+        self.boards = set()
+        self.running = True
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, servo, angle):
+        with self.lock:
+            self.pending[servo] = angle
+        self.wakeup.set()
+
+    def flush(self, board):
+        with self.lock:
+            self.boards.add(board)
+        self.wakeup.set()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                boards, self.boards = self.boards, set()
+            for servo in pending:
+                servo.angle = pending[servo]
+            for board in boards:
+                board.flush()
+            self.writes += len(pending)
+            self.flushes += len(boards)
+
+    def stats(self):
+        stats = {'writes': self.writes, 'flushes': self.flushes}
+        if hasattr(self.bus, 'stats'):
+            stats.update(self.bus.stats())
+        return stats
+
+class NewsPublisher(threading.Thread):
+    # Publishes the completion of movements. nw0 sockets belong to the thread that
+    # made them and making the publisher socket pauses to let it connect, so it is
+    # made here when the supervisor starts rather than by the motion thread when
+    # the first movement completes, and the motion thread only queues the news
+    def __init__(self, address):
+        super().__init__(name = 'NewsPublisher', daemon = True)
+        self.address = address
+        self.queue = queue.SimpleQueue()
+        self.ready = threading.Event()
+        self.published = 0
+
+    def publish(self, topic, data):
+        self.queue.put((topic, data))
+
+    def stop(self):
+        self.queue.put(None)
+
+    def run(self):
+        # The first news makes the socket, no one is waiting for this topic
+        nw0.send_news_to(self.address, 'supervisor:started')
+        self.ready.set()
+        while True:
+            news = self.queue.get()
+            if news is None:
+                break
+            nw0.send_news_to(self.address, *news)
+            self.published += 1
+
+class QueuedServo:
+    # Stands in for a servo, setting the angle queues the write on the writer for
+    # the bus the servo is on. Everything else is passed through to the servo
+    def __init__(self, writer, servo):
+        self.__dict__['writer'] = writer
+        self.__dict__['servo'] = servo
+
+    def __getattr__(self, name):
+        return getattr(self.servo, name)
+
+    def __setattr__(self, name, value):
+        if name == 'angle':
+            self.writer.write(self.servo, value)
+        else:
+            setattr(self.servo, name, value)
+
+class MotionScheduler(threading.Thread):
+    def __init__(self, engine, rate = 50):
+        super().__init__(name = 'MotionScheduler', daemon = True)
+        self.engine = engine
+        self.interval = 1.0 / rate # Seconds between ticks
+        # The lock must be held by anything that changes the target of an item
+        # so that the target is not changed part way through a tick
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.active = 0
+        # Called from this thread with the engine index of each servo that reaches
+        # the end of its movement
+        self.on_complete = None
+        # Called from this thread after each tick
+        self.on_tick = None
+        self.running = True
+        self.ticks = 0
+        self.overruns = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+        self.total_active = 0
+        self.max_active = 0
+        self.tick_time = LatencyHistogram()
+
+    def start_moving(self, item):
+        # Must be called with the lock held. The thread is woken even if the item
+        # did not need to move so that its completion is passed on
+        if item.is_active():
+            self.active = self.engine.active_count()
+        self.wakeup.set()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def stats(self):
+        return {'ticks': self.ticks,
+                'overruns': self.overruns,
+                'mean_jitter': self.total_jitter / self.ticks if self.ticks else 0.0,
+                'max_jitter': self.max_jitter,
+                'active': self.active,
+                'mean_active': self.total_active / self.ticks if self.ticks else 0.0,
+                'max_active': self.max_active,
+                'tick_time': self.tick_time.snapshot()}
+
+    def tick(self):
+        started = ticks_ms()
+        with self.lock:
+            moving = self.active
+            self.active = self.engine.tick()
+        self.total_active += moving
+        if moving > self.max_active:
+            self.max_active = moving
+        self.tick_time.record(ticks_ms() - started)
+        if self.on_tick:
+            self.on_tick()
+        self.complete()
+
+    def complete(self):
+        with self.lock:
+            completed = self.engine.take_completed()
+        if self.on_complete:
+            for ndx in completed:
+                self.on_complete(ndx)
+
+    def run(self):
+        next_tick = ticks_ms()
+        while self.running:
+            if not self.active:
+                # Nothing to move so sleep until something starts moving
+                self.wakeup.wait()
+                self.wakeup.clear()
+                self.complete()
+                next_tick = ticks_ms()
+                continue
+            delay = next_tick - ticks_ms()
+            if delay > 0:
+                sleep(delay)
+            jitter = ticks_ms() - next_tick
+            self.tick()
+            self.ticks += 1
+            self.total_jitter += jitter
+            if jitter > self.max_jitter:
+                self.max_jitter = jitter
+            next_tick += self.interval
+            if ticks_ms() > next_tick:
+                # The tick took longer than the interval, don't try and catch up
+                # with the ticks that were missed
+                self.overruns += 1
+                next_tick = ticks_ms()
 
 class Supervisor:
-    def __init__(self, id, channels = 16):
+    def __init__(self, id, channels = 16, update_rate = 50, boards = None, backend = 'servokit', trace = None):
+        # boards is a list of (bus, address) for each PCA9685 board, a bus of None
+        # is the default I2C bus. Turnouts and signals on the first board can give
+        # just the channel, otherwise the channel is given as (board, channel).
+        # With the 'native' backend the boards are driven directly and every channel
+        # that changes in a tick is sent in one write per board, a bus may then also
+        # be an I2C object such as a FakeI2C. trace is a file to write the spans of
+        # traced requests to when the supervisor shuts down
         self.id = id
         self.turnouts = {}
         self.signals = {}
-        self.kit = ServoKit(channels = channels)
+        if boards is None:
+            boards = [(None, 0x40)]
+        if backend not in ('servokit', 'native'):
+            raise ValueError(f'Invalid servo backend \'{backend}\', valid backends are servokit or native')
+        self.backend = backend
+        self.kits = []
+        self.boards = [] # (bus, board) for boards driven directly
+        self.servos = []
+        self.writers = {}
+        self.buses = {}
+        for bus, address in boards:
+            if bus not in self.writers:
+                self.writers[bus] = BusWriter(bus)
+                self.writers[bus].start()
+                if hasattr(bus, 'writeto'):
+                    self.buses[bus] = bus
+                elif bus is not None:
+                    self.buses[bus] = ExtendedI2C(bus)
+                elif backend == 'native':
+                    self.buses[bus] = default_i2c()
+            if backend == 'native':
+                kit = PCA9685Kit(self.buses[bus], address)
+                self.boards.append((bus, kit.board))
+                self.servos.append(kit.servo)
+            else:
+                if bus is None:
+                    kit = ServoKit(channels = channels, address = address)
+                else:
+                    kit = ServoKit(channels = channels, i2c = self.buses[bus], address = address)
+                self.servos.append([QueuedServo(self.writers[bus], servo) for servo in kit.servo])
+            self.kits.append(kit)
+        self.kit = self.kits[0]
+        self.engine = ServoEngine()
+        self.motion = MotionScheduler(self.engine, update_rate) # Movement updates per second
+        self.motion.on_complete = self.completed
+        if backend == 'native':
+            self.motion.on_tick = self.flush
+        self.items = {} # Engine index to (kind, item)
+        self.news_address = None
+        self.news = None
+        # How long the message loop spends on each kind of message and how long it
+        # waits between them
+        self.latencies = {}
+        self.iterations = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        # The trace id of the message being handled, if it has one, and the trace
+        # id and start time of each item it set moving
+        self.tracer = Tracing.Tracer('supervisor ' + id, trace) if trace else None
+        self.trace_id = None
+        self.traces = {}
 
     def reply(self, address, status):
         nw0.send_reply_to(address, status)
@@ -291,101 +559,263 @@ class Supervisor:
     def reply_error(self, address):
         self.reply(address, 'error')
     
+    def servo(self, channel):
+        if isinstance(channel, tuple):
+            board, channel = channel
+        else:
+            board = 0
+        return self.servos[board][channel]
+
+    def flush(self):
+        # Have the writer of each bus send what has changed on its boards
+        for bus, board in self.boards:
+            self.writers[bus].flush(board)
+
     def add_turnout(self, turnout):
         # Patch up the turnout so that it can move itself
-        turnout.servo = self.kit.servo[turnout.channel]
-        turnout.initial_position()
+        turnout.attach(self.engine, self.servo(turnout.channel))
         self.turnouts[turnout.id] = turnout
+        self.items[turnout.ndx] = ('turnout', turnout)
+        self.flush()
     
     def add_signal(self, signal):
         # Patch up the signal so that it can move itself
-        signal.servo = self.kit.servo[signal.channel]
-        signal.initial_position()
+        signal.attach(self.engine, self.servo(signal.channel))
         self.signals[signal.id] = signal
+        self.items[signal.ndx] = ('signal', signal)
+        self.flush()
     
+    def start_moving(self, item):
+        # A movement started without a trace replaces any traced one of the item
+        if self.tracer and self.trace_id is not None:
+            self.traces[item.ndx] = (self.trace_id, ticks_ms())
+        else:
+            self.traces.pop(item.ndx, None)
+        self.motion.start_moving(item)
+
+    def completed(self, ndx):
+        # Let anyone listening know that an item has reached where it was sent,
+        # the topic is the kind and id of the item and the data is the position
+        if ndx not in self.items:
+            return
+        kind, item = self.items[ndx]
+        trace = self.traces.pop(ndx, None)
+        if trace:
+            self.tracer.add('motion ' + kind + ':' + item.id, trace[0], trace[1], ticks_ms(), 'motion', position = item.requested_position)
+        if self.news:
+            self.news.publish(kind + ':' + item.id, item.requested_position)
+
+    def command(self, command):
+        # Carry out a single command that has already been split into its
+        # parts and return the status that should be sent back
+        if len(command) < 3:
+            return 'error'
+        if command[0] == 'set' and len(command) == 4:
+            if command[1] == 'turnout':
+                if command[2] in self.turnouts:
+                    if command[3] == 'normal':
+                        self.turnouts[command[2]].normal()
+                        self.start_moving(self.turnouts[command[2]])
+                        return 'ok'
+                    elif command[3] == 'reverse':
+                        self.turnouts[command[2]].reverse()
+                        self.start_moving(self.turnouts[command[2]])
+                        return 'ok'
+            elif command[1] == 'signal':
+                if command[2] in self.signals:
+                    if command[3] == 'clear':
+                        self.signals[command[2]].clear()
+                        self.start_moving(self.signals[command[2]])
+                        return 'ok'
+                    elif command[3] == 'danger':
+                        self.signals[command[2]].danger()
+                        self.start_moving(self.signals[command[2]])
+                        return 'ok'
+        elif command[0] == 'status':
+            # Either 'set' or 'moving:' followed by the percentage of the movement done
+            if command[1] == 'turnout':
+                if command[2] in self.turnouts:
+                    return self.turnouts[command[2]].status()
+            elif command[1] == 'signal':
+                if command[2] in self.signals:
+                    return self.signals[command[2]].status()
+        elif command[0] == 'exists':
+            if command[1] == 'turnout':
+                if command[2] in self.turnouts:
+                    return 'ok'
+            elif command[1] == 'signal':
+                if command[2] in self.signals:
+                    return 'ok'
+        return 'error'
+
+    def inventory(self):
+        # Every item looked after as 'kind:id' separated by '|'
+        items = ['turnout:' + id for id in self.turnouts] + ['signal:' + id for id in self.signals]
+        return '|'.join(items)
+
+    def register(self, items):
+        # Give the handle for each 'kind:id' separated by '|', a handle is the index
+        # of the item's servo in the engine so it is the same for every panel
+        handles = []
+        for item in items.split('|'):
+            try:
+                kind, id = item.split(':', 1)
+            except ValueError:
+                return 'error'
+            if kind == 'turnout' and id in self.turnouts:
+                handles.append(str(self.turnouts[id].ndx))
+            elif kind == 'signal' and id in self.signals:
+                handles.append(str(self.signals[id].ndx))
+            else:
+                return 'error'
+        return '|'.join(handles)
+
+    def operate(self, operation, handle):
+        # Carry out a single binary command, must be called with the motion lock held
+        # unless it is a status which changes nothing
+        if handle in self.items:
+            kind, item = self.items[handle]
+            if operation == WireProtocol.OP_STATUS:
+                if item.is_on_target():
+                    return (WireProtocol.REPLY_SET, 0)
+                return (WireProtocol.REPLY_MOVING, int(self.engine.progress(handle) * 100))
+            if kind == 'turnout':
+                if operation == WireProtocol.OP_NORMAL:
+                    item.normal()
+                    self.start_moving(item)
+                    return (WireProtocol.REPLY_OK, 0)
+                elif operation == WireProtocol.OP_REVERSE:
+                    item.reverse()
+                    self.start_moving(item)
+                    return (WireProtocol.REPLY_OK, 0)
+            elif kind == 'signal':
+                if operation == WireProtocol.OP_CLEAR:
+                    item.clear()
+                    self.start_moving(item)
+                    return (WireProtocol.REPLY_OK, 0)
+                elif operation == WireProtocol.OP_DANGER:
+                    item.danger()
+                    self.start_moving(item)
+                    return (WireProtocol.REPLY_OK, 0)
+        return (WireProtocol.REPLY_ERROR, 0)
+
+    def binary(self, message):
+        # A message that can't be decoded gets a single error record back
+        try:
+            operations = WireProtocol.decode(message)
+        except ValueError:
+            return WireProtocol.encode_reply([(WireProtocol.REPLY_ERROR, 0)])
+        if len(operations) == 1:
+            # Most messages are a single command, usually a status while a panel waits
+            # for an item, and only a change of target needs the lock
+            operation, handle = operations[0]
+            if operation == WireProtocol.OP_STATUS:
+                reply = self.operate(operation, handle)
+            else:
+                with self.motion.lock:
+                    reply = self.operate(operation, handle)
+            return WireProtocol.encode_reply((reply,))
+        with self.motion.lock:
+            replies = [self.operate(operation, handle) for operation, handle in operations]
+        return WireProtocol.encode_reply(replies)
+
+    def locked_command(self, command):
+        with self.motion.lock:
+            return self.command(command)
+
+    def batch(self, commands):
+        # A batch is a number of commands separated by '|', each one is carried
+        # out in order and the statuses are sent back in the same order, also
+        # separated by '|'
+        statuses = []
+        for command in commands.split('|'):
+            command = command.split(':')
+            if command[0] in ('batch', 'shutdown'):
+                statuses.append('error')
+            else:
+                statuses.append(self.locked_command(command))
+        return '|'.join(statuses)
+
+    VERBS = ('set', 'status', 'exists', 'shutdown', 'news', 'inventory', 'register', 'batch', 'stats', 'binary')
+
+    def record(self, verb, duration):
+        if verb not in Supervisor.VERBS:
+            verb = 'other'
+        if verb not in self.latencies:
+            self.latencies[verb] = LatencyHistogram()
+        self.latencies[verb].record(duration)
+
+    def stats(self):
+        # A snapshot of the counters, nothing is locked so it can be asked for as
+        # often as wanted without holding up the motion thread
+        return {'id': self.id,
+                'commands': {verb: self.latencies[verb].snapshot() for verb in list(self.latencies)},
+                'loop': {'iterations': self.iterations,
+                         'busy': self.busy,
+                         'idle': self.idle},
+                'motion': self.motion.stats(),
+                'servos': {'count': self.engine.count,
+                           'active': self.engine.active_count()},
+                'writes': self.engine.write_stats(),
+                'buses': {str(getattr(bus, 'bus_id', bus)): self.writers[bus].stats() for bus in self.writers}}
+
     def run(self):
         address = nw0.advertise(self.id)
+        # Completion of movements is published as news, a panel asks for the
+        # address with the 'news' command
+        self.news_address = nw0.advertise(self.id + ':news')
+        self.news = NewsPublisher(self.news_address)
+        self.news.start()
+        self.news.ready.wait()
+        # Movement is handled by its own thread so the loop here only has to wait
+        # for messages
+        self.motion.start()
 
+        waiting = ticks_ms()
         while True:
-            message = nw0.wait_for_message_from(address, wait_for_s = 0.01)
-            if message is not None:
+            message = nw0.wait_for_message_from(address)
+            started = ticks_ms()
+            self.idle += started - waiting
+            # A traced request has 'trace:<id>:' in front of the message
+            trace, message = Tracing.split(message)
+            self.trace_id = trace
+            if message is not None and message.startswith(WireProtocol.MARK):
+                verb = 'binary'
+                self.reply(address, self.binary(message))
+            elif message is not None:
                 print('Got:', message)
-                command = message.split(':')
-                print(command)
-                if command[0] == 'set':
-                    if command[1] == 'turnout':
-                        if command[2] in self.turnouts:
-                            if command[3] in ('normal', 'reverse'):
-                                if command[3] == 'normal':
-                                    self.turnouts[command[2]].normal()
-                                elif command[3] == 'reverse':
-                                    self.turnouts[command[2]].reverse()
-                                self.reply_ok(address)
-                            else:
-                                self.reply_error(address)
-                        else:
-                            self.reply_error(address)
-                    elif command[1] == 'signal':
-                        if command[2] in self.signals:
-                            if command[3] in ('clear', 'danger'):
-                                if command[3] == 'clear':
-                                    self.signals[command[2]].clear()
-                                elif command[3] == 'danger':
-                                    self.signals[command[2]].danger()
-                                self.reply_ok(address)
-                            else:
-                                self.reply_error(address)
-                        else:
-                            self.reply_error(address)
-                    else:
-                        self.reply_error(address)
-                elif command[0] == 'status':
-                    if command[1] == 'turnout':
-                        if command[2] in self.turnouts:
-                            self.turnouts[command[2]].counter += 1
-                            if self.turnouts[command[2]].counter < 70:
-                                status = 'moving:' + str(self.turnouts[command[2]].counter)
-                                self.kit.servo[self.turnouts[command[2]].channel].angle = 55.0 + self.turnouts[command[2]].counter
-                            else:
-                                status = 'set'
-                            self.reply(address, status)
-                        else:
-                            self.reply_error(address)
-                    elif command[1] == 'signal':
-                        if command[2] in self.signals:
-                            self.signals[command[2]].counter += 1
-                            if self.signals[command[2]].counter < 70:
-                                status = 'moving:' + str(self.signals[command[2]].counter)
-                                self.kit.servo[self.signals[command[2]].channel].angle = 55.0 + self.turnouts[command[2]].counter
-                            else:
-                                status = 'set'
-                            self.reply(address, status)
-                    else:
-                        self.reply_error(address)
-                elif command[0] == 'exists':
-                    if command[1] == 'turnout':
-                        if command[2] in self.turnouts:
-                            self.reply_ok(address)
-                        else:
-                            self.reply_error(address)
-                    elif command[1] == 'signal':
-                        if command[2] in self.signals:
-                            self.reply_ok(address)
-                        else:
-                            self.reply_error(address)
-                    else:
-                        self.reply_error(address)
-                elif command[0] == 'shutdown':
+                command = message.split(':', 1)
+                verb = command[0]
+                if command[0] == 'shutdown':
                     self.reply(address, 'bye')
                     break
+                elif command[0] == 'stats':
+                    self.reply(address, self.stats())
+                elif command[0] == 'news':
+                    self.reply(address, self.news_address)
+                elif command[0] == 'inventory':
+                    self.reply(address, self.inventory())
+                elif command[0] == 'register' and len(command) == 2:
+                    self.reply(address, self.register(command[1]))
+                elif command[0] == 'batch' and len(command) == 2:
+                    self.reply(address, self.batch(command[1]))
                 else:
-                    self.reply_error(address)
-            for signal in self.signals:
-                if self.signals[signal].is_active():
-                    self.signals[signal].update()
-            for turnout in self.turnouts:
-                if self.turnouts[turnout].is_active():
-                    self.turnouts[turnout].update()
+                    self.reply(address, self.locked_command(message.split(':')))
+            else:
+                verb = 'other'
+            waiting = ticks_ms()
+            self.iterations += 1
+            self.busy += waiting - started
+            self.record(verb, waiting - started)
+            if trace and self.tracer:
+                self.tracer.add('supervisor ' + verb, trace, started, waiting, 'supervisor')
+            self.trace_id = None
+        self.motion.stop()
+        self.news.stop()
+        for bus in self.writers:
+            self.writers[bus].stop()
+        if self.tracer and self.tracer.path:
+            self.tracer.export()
 
 def Main():
 #    from LayoutControlLite import Supervisor
@@ -0,0 +1,113 @@
+import heapq
+from math import floor, hypot
+
+class Topology:
+    # The connections between items worked out from where their ends are drawn. The
+    # end of every track is hashed into a grid so that ends drawn within tolerance
+    # of each other become the same node without comparing every pair of ends. A
+    # turnout is a pair of edges, entry to normal and entry to reverse, so that a
+    # path can't run from the normal to the reverse side through the points
+    def __init__(self, tolerance = 5):
+        self.tolerance = tolerance
+        self.grid = {}
+        self.nodes = []
+        self.edges = [] # Per node, a list of (node, length, item, position)
+        self.ends = {}
+        self.terminals = {} # Per item, the nodes that a path starts or ends at
+        self.paths = {}
+
+    def node(self, location):
+        cell_x = floor(location[0] / self.tolerance)
+        cell_y = floor(location[1] / self.tolerance)
+        for x in range(cell_x - 1, cell_x + 2):
+            for y in range(cell_y - 1, cell_y + 2):
+                for ndx in self.grid.get((x, y), ()):
+                    node = self.nodes[ndx]
+                    if hypot(location[0] - node[0], location[1] - node[1]) <= self.tolerance:
+                        return ndx
+        ndx = len(self.nodes)
+        self.nodes.append(location)
+        self.edges.append([])
+        self.grid.setdefault((cell_x, cell_y), []).append(ndx)
+        return ndx
+
+    def _connect(self, start, end, length, item, position):
+        self.edges[start].append((end, length, item, position))
+        self.edges[end].append((start, length, item, position))
+        self.paths = {}
+
+    def add_track(self, item, start_location, end_location):
+        start = self.node(start_location)
+        end = self.node(end_location)
+        self._connect(start, end, hypot(end_location[0] - start_location[0], end_location[1] - start_location[1]), item, None)
+        self.ends[item] = self.terminals[item] = (start, end)
+
+    def add_turnout(self, item, location, entry_location, normal_location, reverse_location):
+        entry = self.node(entry_location)
+        normal = self.node(normal_location)
+        reverse = self.node(reverse_location)
+        entry_length = hypot(entry_location[0] - location[0], entry_location[1] - location[1])
+        self._connect(entry, normal, entry_length + hypot(normal_location[0] - location[0], normal_location[1] - location[1]), item, 'normal')
+        self._connect(entry, reverse, entry_length + hypot(reverse_location[0] - location[0], reverse_location[1] - location[1]), item, 'reverse')
+        self.ends[item] = (entry, normal, reverse)
+        # A path to or from a turnout is taken to be at its entry so that the path
+        # goes through the points, and their setting is part of it, unless it leaves
+        # by the entry
+        self.terminals[item] = (entry,)
+
+    def path(self, start, end):
+        # The turnout settings, a list of (turnout, position), for the shortest path
+        # from an end of start to an end of end, or None if they aren't connected
+        key = (start, end)
+        if key not in self.paths:
+            self.paths[key] = self._search(start, end)
+            if self.paths[key] is not None:
+                self.paths[(end, start)] = list(reversed(self.paths[key]))
+        return self.paths[key]
+
+    def _search(self, start, end):
+        if start not in self.ends or end not in self.ends:
+            return None
+        if start is end:
+            return []
+        targets = set(self.terminals[end])
+        # A state is a node and the item used to reach it, the same item can't be
+        # used to leave so that paths don't double back through a turnout. Nothing
+        # has been used to reach the start so a path can leave through a turnout
+        # it starts at
+        queue = []
+        best = {}
+        came_from = {}
+        for node in self.terminals[start]:
+            state = (node, None)
+            best[state] = 0.0
+            came_from[state] = None
+            heapq.heappush(queue, (0.0, node, id(start), state))
+        done = set()
+        while queue:
+            distance, node, unused, state = heapq.heappop(queue)
+            if state in done:
+                continue
+            done.add(state)
+            if node in targets:
+                return self._settings(came_from, state)
+            for neighbour, length, item, position in self.edges[node]:
+                if item is state[1]:
+                    continue
+                following = (neighbour, item)
+                if following in done or following in best and best[following] <= distance + length:
+                    continue
+                best[following] = distance + length
+                came_from[following] = (state, position)
+                heapq.heappush(queue, (distance + length, neighbour, id(item), following))
+        return None
+
+    def _settings(self, came_from, state):
+        settings = []
+        while came_from[state] is not None:
+            previous, position = came_from[state]
+            if position:
+                settings.append((state[1], position))
+            state = previous
+        settings.reverse()
+        return settings
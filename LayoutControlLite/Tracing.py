@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from time import monotonic, time
+
+# A trace follows one request, a route being set or an item being changed, from
+# the panel through the supervisor to the servos reaching their positions. The
+# panel makes up a trace id and sends it in front of the command as
+# 'trace:<id>:<command>' so that the spans recorded by each process can be matched
+# up. Spans are written as Chrome trace events, open the files in chrome://tracing
+# or Perfetto. Times are taken from the monotonic clock and written as wall clock
+# time so that files from a panel and its supervisors line up
+PREFIX = 'trace:'
+
+def split(message):
+    # Returns the trace id, or None, and the message without it. A message with a
+    # malformed prefix is returned as it is, it is then an unknown command
+    if isinstance(message, str) and message.startswith(PREFIX):
+        parts = message.split(':', 2)
+        if len(parts) == 3 and parts[1]:
+            return parts[1], parts[2]
+    return None, message
+
+def tag(trace, message):
+    if trace is None:
+        return message
+    return PREFIX + trace + ':' + message
+
+class Tracer:
+    def __init__(self, process, path = None):
+        self.process = process
+        self.path = path
+        self.offset = time() - monotonic()
+        self.lock = threading.Lock()
+        self.events = []
+        self.threads = {}
+
+    def new_trace(self):
+        return uuid.uuid4().hex[:16]
+
+    def now(self):
+        return monotonic()
+
+    def add(self, name, trace, start, end, category = 'layout', **args):
+        # start and end are from the monotonic clock, as now() gives
+        thread = threading.current_thread()
+        args['trace_id'] = trace
+        event = {'name': name,
+                 'cat': category,
+                 'ph': 'X',
+                 'ts': (start + self.offset) * 1000000,
+                 'dur': max(0.0, end - start) * 1000000,
+                 'pid': os.getpid(),
+                 'tid': thread.ident,
+                 'args': args}
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+    @contextmanager
+    def span(self, name, trace, category = 'layout', **args):
+        start = monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, trace, start, monotonic(), category, **args)
+
+    def export(self, path = None):
+        # Write the spans in the Chrome trace event format
+        if path is None:
+            path = self.path
+        pid = os.getpid()
+        with self.lock:
+            events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.process}}]
+            for ident, name in self.threads.items():
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident, 'args': {'name': name}})
+            events.extend(self.events)
+        with open(path, 'w') as output:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, output)
+        return path
@@ -0,0 +1,107 @@
+import base64
+import struct
+
+# The compact form of the supervisor protocol. Once a panel has registered its
+# items with a supervisor each item is known by a small number, its handle, and
+# a command is a fixed size record of an operation and a handle. networkzero
+# only carries text so a binary message is sent as MARK followed by the records
+# in base64, no text command starts with MARK
+MARK = '#'
+
+COMMAND = struct.Struct('>BH') # Operation, handle
+REPLY = struct.Struct('>BB') # Status, percentage moved
+
+OP_NORMAL = 1
+OP_REVERSE = 2
+OP_CLEAR = 3
+OP_DANGER = 4
+OP_STATUS = 5
+
+REPLY_OK = 0
+REPLY_ERROR = 1
+REPLY_SET = 2
+REPLY_MOVING = 3
+
+# The text commands for each kind of item and the operation each one becomes
+OPERATIONS = {'turnout': (('set', 'normal', OP_NORMAL), ('set', 'reverse', OP_REVERSE), ('status', None, OP_STATUS)),
+              'signal': (('set', 'clear', OP_CLEAR), ('set', 'danger', OP_DANGER), ('status', None, OP_STATUS))}
+
+def records_for(kind, id, handle):
+    # Every text command for an item paired with the binary message that does the
+    # same, so that a panel can swap one for the other without parsing or encoding
+    # anything
+    messages = {}
+    for verb, position, operation in OPERATIONS[kind]:
+        command = verb + ':' + kind + ':' + id
+        if position:
+            command += ':' + position
+        messages[command] = encode([COMMAND.pack(operation, handle)])
+    return messages
+
+def join(messages):
+    # Put messages of single commands together into one message. A command record
+    # is three bytes, which base64 makes into four characters with no padding, so
+    # the records can be joined without decoding them
+    return MARK + ''.join(message[len(MARK):] for message in messages)
+
+def encode(records):
+    return MARK + base64.b64encode(b''.join(records)).decode('ascii')
+
+MAX_DECODED = 1024 # Messages of a single command kept once decoded
+
+_decoded = {}
+
+def decode(message):
+    # Returns a tuple of the records, raises ValueError if the message is not whole
+    # records in base64. A panel sends the same few single commands over and over
+    # so those are only decoded once
+    records = _decoded.get(message)
+    if records is not None:
+        return records
+    data = base64.b64decode(message[len(MARK):].encode('ascii'), validate = True)
+    if len(data) % COMMAND.size:
+        raise ValueError('Binary message of ' + str(len(data)) + ' bytes is not a whole number of records')
+    records = tuple(COMMAND.unpack_from(data, offset) for offset in range(0, len(data) - COMMAND.size + 1, COMMAND.size))
+    if len(records) == 1:
+        if len(_decoded) >= MAX_DECODED:
+            _decoded.clear()
+        _decoded[message] = records
+    return records
+
+def _text(status, percent):
+    # The text status the rest of the panel uses for a reply record
+    if status == REPLY_OK:
+        return 'ok'
+    elif status == REPLY_SET:
+        return 'set'
+    elif status == REPLY_MOVING:
+        return 'moving:' + str(percent)
+    return 'error'
+
+# Every reply record is known up front so replies are looked up rather than built
+# or taken apart. _reply_messages is the message of each single reply,
+# _reply_records the text of each record and _reply_texts the text of each single
+# reply message
+_reply_messages = {}
+_reply_records = {}
+_reply_texts = {}
+for _status in (REPLY_OK, REPLY_ERROR, REPLY_SET, REPLY_MOVING):
+    for _percent in range(256):
+        _record = REPLY.pack(_status, _percent)
+        _message = MARK + base64.b64encode(_record).decode('ascii')
+        _reply_messages[(_status, _percent)] = _message
+        _reply_records[_record] = _reply_texts[_message] = _text(_status, _percent)
+del _status, _percent, _record, _message
+
+def encode_reply(replies):
+    if len(replies) == 1 and replies[0] in _reply_messages:
+        return _reply_messages[replies[0]]
+    return MARK + base64.b64encode(b''.join(REPLY.pack(status, percent) for status, percent in replies)).decode('ascii')
+
+def decode_reply(message):
+    # Turn the reply records back into the text statuses the rest of the panel uses
+    text = _reply_texts.get(message)
+    if text is not None:
+        return [text]
+    data = base64.b64decode(message[len(MARK):].encode('ascii'))
+    return [_reply_records.get(data[offset:offset + REPLY.size], 'error') for offset in range(0, len(data) - REPLY.size + 1, REPLY.size)]
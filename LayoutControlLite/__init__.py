@@ -3,14 +3,44 @@ __package__ = 'LayoutControlLite'
 __version__ = '0.5.0'
 __author__ = 'Anthony Shaw'
 
-from .LayoutControlLite import Signal
-from .LayoutControlLite import Track
-from .LayoutControlLite import Stub
-from .LayoutControlLite import Turnout
-from .LayoutControlLite import Block
-from .LayoutControlLite import Route
-from .LayoutControlLite import Layout
-from .LayoutControlLite import PushButton
-from .LayoutControlLite import Main
-from .LayoutControlLite import set_default
-from .Supervisor import Supervisor
+import importlib
+import sys
+import types
+
+# Names are imported from their modules when first used so that a supervisor
+# doesn't load the panel and its GUI, and a panel doesn't load the supervisor
+_exports = {'Signal': 'LayoutControlLite',
+            'Track': 'LayoutControlLite',
+            'Stub': 'LayoutControlLite',
+            'Turnout': 'LayoutControlLite',
+            'Block': 'LayoutControlLite',
+            'Route': 'LayoutControlLite',
+            'Layout': 'LayoutControlLite',
+            'PushButton': 'LayoutControlLite',
+            'Main': 'LayoutControlLite',
+            'set_default': 'LayoutControlLite',
+            'Supervisor': 'Supervisor'}
+
+__all__ = list(_exports)
+
+class _Package(types.ModuleType):
+    # Importing a submodule sets an attribute of the same name on the package, the
+    # Supervisor module for one. An exported name of the same name as its module is
+    # kept as what it exports whichever order things are imported in
+    def __setattr__(self, name, value):
+        if isinstance(value, types.ModuleType) and _exports.get(name) == name and hasattr(value, name):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = _Package
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module('.' + _exports[name], __package__), name)
+        # Set the name after the import as the import may have set it to the module
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module \'{__name__}\' has no attribute \'{name}\'')
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,56 @@
+# Synthetic presses per second through the InputEngine. Presses for a number of
+# buttons are made on a simulated clock with some of them bouncing and some of
+# them repeated within the coalescing window, the engine has to keep up and end
+# with the same net state as applying every accepted press one at a time.
+#
+# Run from the top of the repository with: python benchmarks/input_engine.py
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from LayoutControlLite.InputEngine import InputEngine
+
+PRESSES = 200000
+BUTTONS = 64
+RATE = 5000 # Synthetic presses per simulated second
+
+def make_presses():
+    generator = random.Random(1)
+    presses = []
+    now = 0.0
+    for ndx in range(PRESSES):
+        now += generator.expovariate(RATE)
+        presses.append((now, generator.randrange(BUTTONS)))
+    return presses
+
+def main():
+    presses = make_presses()
+    engine = InputEngine()
+    state = [False] * BUTTONS
+    expected = [False] * BUTTONS
+    actions = [lambda ndx = ndx: state.__setitem__(ndx, not state[ndx]) for ndx in range(BUTTONS)]
+
+    started = perf_counter()
+    for now, button in presses:
+        if engine.press(button, actions[button], now):
+            expected[button] = not expected[button]
+        engine.run_due(now)
+    engine.run_due(presses[-1][0] + engine.window)
+    elapsed = perf_counter() - started
+
+    stats = engine.stats()
+    result = {'presses_per_s': PRESSES / elapsed,
+              'accepted': stats['presses'],
+              'bounces': stats['bounces'],
+              'actions': stats['actions'],
+              'cancelled': stats['cancelled'],
+              'consistent': state == expected}
+    print('%10.0f presses/s, %d accepted, %d bounces, %d actions, %d cancelled, consistent %s' %
+          (result['presses_per_s'], result['accepted'], result['bounces'], result['actions'], result['cancelled'], result['consistent']))
+    return [result]
+
+if __name__ == '__main__':
+    main()
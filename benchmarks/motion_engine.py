@@ -0,0 +1,93 @@
+# Compare the cost of one motion tick using the array backed ServoEngine against
+# the original loop that called update() on each Turnout object in turn.
+#
+# Run from the top of the repository with: python benchmarks/motion_engine.py
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from LayoutControlLite.ServoEngine import ServoEngine
+
+SERVO_COUNTS = (16, 128, 1024)
+TICKS = 200
+TICK_INTERVAL = 0.02
+
+class NullServo:
+    def __init__(self):
+        self.angle = 0
+
+class LegacyTurnout:
+    # The per object movement code the supervisor used before the ServoEngine,
+    # kept here as the baseline to compare against
+    def __init__(self, servo, move_speed = 30):
+        self.servo = servo
+        self.move_speed = move_speed
+        self.current_position = 0
+        self.start_position = 0
+        self.target_position = 0
+        self.move_start_ms = 0
+        self.direction = 0
+
+    def set_target(self, target, now):
+        if self.current_position != target:
+            self.start_position = self.current_position
+            self.target_position = target
+            self.move_start_ms = now
+            self.direction = -1 if target < self.current_position else 1
+
+    def is_active(self):
+        return self.direction != 0
+
+    def update(self, now):
+        if self.direction:
+            t = now - self.move_start_ms
+            next_position = self.start_position + (self.move_speed * t * self.direction)
+            if self.direction > 0:
+                if next_position > self.target_position:
+                    next_position = self.target_position
+            else:
+                if next_position < self.target_position:
+                    next_position = self.target_position
+            self.current_position = next_position
+            self.servo.angle = next_position + 90.0
+            if self.target_position == self.current_position:
+                self.direction = 0
+
+def bench_legacy(count):
+    turnouts = [LegacyTurnout(NullServo()) for _ in range(count)]
+    for turnout in turnouts:
+        turnout.set_target(1000, 0.0)
+    started = perf_counter()
+    for tick in range(TICKS):
+        now = tick * TICK_INTERVAL
+        for turnout in turnouts:
+            if turnout.is_active():
+                turnout.update(now)
+    return (perf_counter() - started) / TICKS
+
+def bench_engine(count):
+    engine = ServoEngine()
+    for _ in range(count):
+        engine.add(NullServo(), 0, 30, 30, offset = 90.0)
+    for ndx in range(count):
+        engine.move(ndx, (1000,), now = 0.0)
+    started = perf_counter()
+    for tick in range(TICKS):
+        engine.tick(tick * TICK_INTERVAL)
+    return (perf_counter() - started) / TICKS
+
+def main():
+    # Every servo is kept moving for the whole run so each tick does the full work
+    print('%8s %14s %14s %8s' % ('servos', 'legacy us/tick', 'engine us/tick', 'speedup'))
+    results = []
+    for count in SERVO_COUNTS:
+        legacy = bench_legacy(count)
+        engine = bench_engine(count)
+        results.append({'servos': count, 'legacy_s': legacy, 'engine_s': engine})
+        print('%8d %14.1f %14.1f %8.2f' % (count, legacy * 1e6, engine * 1e6, legacy / engine))
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# The cost of the motion profiles: compiling a move into a timeline, finding a
+# timeline that has already been compiled, and a tick of the ServoEngine with
+# every servo following each kind of profile. Every servo uses one shared profile,
+# so however many servos there are the engine holds only one table per move.
+#
+# Run from the top of the repository with: python benchmarks/motion_profiles.py
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from LayoutControlLite.ServoEngine import ServoEngine
+from LayoutControlLite import MotionProfile
+
+SERVOS = 1024
+TICKS = 100
+TICK_INTERVAL = 0.002 # Short enough that every servo is still moving at the end
+LOOKUPS = 10000
+
+class NullServo:
+    def __init__(self):
+        self.angle = 0
+
+PROFILES = {'linear': (MotionProfile.Linear, 30, 30),
+            'trapezoidal': (MotionProfile.Trapezoidal, 30, 30, 60),
+            's-curve': (MotionProfile.SCurve, 30, 30, 60),
+            'bounce': (MotionProfile.Bounce, 25, 75, 4, 3.0)}
+
+def main():
+    results = []
+    print('%12s %11s %10s %13s %8s' % ('profile', 'compile us', 'lookup us', 'tick us/1024', 'tables'))
+    for name, parameters in PROFILES.items():
+        profile = MotionProfile.shared(*parameters)
+        started = perf_counter()
+        profile.compile(-35.0, (35.0,))
+        compile_time = perf_counter() - started
+        profile.timeline(-35.0, (35.0,))
+        started = perf_counter()
+        for ndx in range(LOOKUPS):
+            profile.timeline(-35.0, (35.0,))
+        lookup = (perf_counter() - started) / LOOKUPS
+
+        engine = ServoEngine()
+        for ndx in range(SERVOS):
+            engine.add(NullServo(), -35.0, 30, 30, profile = MotionProfile.shared(*parameters))
+        for ndx in range(SERVOS):
+            engine.move(ndx, (35.0,), now = 0.0)
+        started = perf_counter()
+        for tick in range(TICKS):
+            engine.tick(tick * TICK_INTERVAL)
+        tick_time = (perf_counter() - started) / TICKS
+        result = {'profile': name,
+                  'compile_us': compile_time * 1e6,
+                  'lookup_us': lookup * 1e6,
+                  'tick_us': tick_time * 1e6,
+                  'tables': len(engine.pooled)}
+        results.append(result)
+        print('%12s %11.1f %10.2f %13.1f %8d' % (name, result['compile_us'], result['lookup_us'], result['tick_us'], result['tables']))
+    return results
+
+if __name__ == '__main__':
+    main()
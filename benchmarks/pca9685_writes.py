@@ -0,0 +1,54 @@
+# I2C transactions and bytes needed to move servos on PCA9685 boards, writing each
+# channel on its own as ServoKit does against one auto-increment block write per
+# board per tick. The boards are on a FakeI2C bus so no hardware is needed, the
+# registers of both are compared at the end to show they end up the same.
+#
+# Run from the top of the repository with: python benchmarks/pca9685_writes.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from LayoutControlLite.ServoEngine import ServoEngine
+from LayoutControlLite.PCA9685 import PCA9685Kit, FakeI2C
+
+TICKS = 100
+RATE = 50 # Ticks per second
+
+def run(boards, servos, block_writes):
+    bus = FakeI2C()
+    kits = [PCA9685Kit(bus, 0x40 + ndx, block_writes = block_writes) for ndx in range(boards)]
+    engine = ServoEngine()
+    for ndx in range(servos):
+        engine.add(kits[ndx // 16].servo[ndx % 16], 0.0, 30.0, 30.0, offset = 90.0)
+    for kit in kits:
+        kit.board.flush()
+    setup = bus.stats()
+    for ndx in range(servos):
+        engine.move(ndx, (35.0 if ndx % 2 else -35.0,), now = 0.0)
+    for tick in range(TICKS):
+        engine.tick(now = tick / RATE)
+        for kit in kits:
+            kit.board.flush()
+    stats = bus.stats()
+    return stats['transactions'] - setup['transactions'], stats['bytes'] - setup['bytes'], bus.registers
+
+def main():
+    results = []
+    for boards, servos in ((1, 4), (1, 16), (4, 64)):
+        channel = run(boards, servos, False)
+        block = run(boards, servos, True)
+        result = {'boards': boards,
+                  'servos': servos,
+                  'per_channel_transactions': channel[0],
+                  'per_channel_bytes': channel[1],
+                  'block_transactions': block[0],
+                  'block_bytes': block[1],
+                  'same_registers': channel[2] == block[2]}
+        results.append(result)
+        print('%d boards %3d servos: per channel %6d transactions %7d bytes, block %5d transactions %7d bytes, same registers %s' %
+              (boards, servos, channel[0], channel[1], block[0], block[1], result['same_registers']))
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# Stand-ins for the hardware and the network so the supervisor and the panel can
+# be measured together in one process on any machine. FakeNetwork has the parts of
+# networkzero that the library uses and passes every message through the same
+# JSON serialisation, FakeServoKit counts the angles written to its servos.
+import itertools
+import json
+import queue
+import threading
+
+def _serialise(message):
+    # The same as networkzero does to everything it sends
+    return json.loads(json.dumps(message).encode('UTF-8').decode('UTF-8'))
+
+class FakeNetwork:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.addresses = itertools.count(1)
+        self.services = {}
+        self.inboxes = {}
+        self.replies = {}
+        self.subscribers = {}
+        self.local = threading.local()
+
+    def advertise(self, name, port = None, ttl_s = None):
+        with self.lock:
+            address = 'fake:' + str(next(self.addresses))
+            self.services[name] = address
+            self.inboxes[address] = queue.SimpleQueue()
+            self.subscribers[address] = []
+        return address
+
+    def discover(self, name, wait_for_s = 60):
+        return self.services.get(name)
+
+    def send_message_to(self, address, message = None, wait_for_reply_s = None):
+        reply = queue.SimpleQueue()
+        self.inboxes[address].put((_serialise(message), reply))
+        return _serialise(reply.get())
+
+    def wait_for_message_from(self, address, wait_for_s = None, autoreply = False):
+        message, reply = self.inboxes[address].get()
+        self.replies[address] = reply
+        return message
+
+    def send_reply_to(self, address, reply = None):
+        self.replies.pop(address).put(reply)
+
+    def send_news_to(self, address, topic, data = None):
+        for subscriber in self.subscribers[address]:
+            subscriber.put((topic, _serialise(data)))
+
+    def wait_for_news_from(self, address, prefix = '', wait_for_s = None, is_raw = False):
+        # Like a subscriber socket, news sent before the first wait is not seen
+        subscriptions = self.local.__dict__.setdefault('subscriptions', {})
+        if address not in subscriptions:
+            subscriptions[address] = queue.SimpleQueue()
+            with self.lock:
+                self.subscribers[address].append(subscriptions[address])
+        return subscriptions[address].get()
+
+class FakeServo:
+    def __init__(self, kit, channel):
+        self.kit = kit
+        self.channel = channel
+        self._angle = None
+
+    @property
+    def angle(self):
+        return self._angle
+
+    @angle.setter
+    def angle(self, angle):
+        self.kit.writes += 1
+        self._angle = angle
+
+class FakeServoKit:
+    def __init__(self, channels = 16, i2c = None, address = 0x40):
+        self.writes = 0
+        self.servo = [FakeServo(self, channel) for channel in range(channels)]
+
+def install(network, supervisor_module = None, panel_module = None, quiet = True):
+    # Put the stand-ins in place of the real modules used by the supervisor and the
+    # panel. The supervisor prints every message it gets, quiet keeps that out of
+    # the benchmark output
+    if supervisor_module:
+        supervisor_module.nw0 = network
+        supervisor_module.ServoKit = FakeServoKit
+        if quiet:
+            supervisor_module.print = lambda *arguments, **options: None
+    if panel_module:
+        panel_module.nw0 = network
+
+class FakeCanvas:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def itemconfigure(self, figure, **options):
+        self.graph.configures += 1
+
+class FakeGraph:
+    # Stands in for the sg.Graph that a layout is drawn on, counts what is drawn
+    def __init__(self):
+        self.figures = itertools.count(1)
+        self.draws = 0
+        self.deletes = 0
+        self.configures = 0
+        self.tk_canvas = FakeCanvas(self)
+
+    def draw_line(self, point_from, point_to, color = 'black', width = 1):
+        self.draws += 1
+        return next(self.figures)
+
+    def draw_circle(self, center_location, radius, fill_color = None, line_color = 'black', line_width = 1):
+        self.draws += 1
+        return next(self.figures)
+
+    def draw_text(self, text, location, color = 'black', font = None, angle = 0, text_location = None):
+        self.draws += 1
+        return next(self.figures)
+
+    def delete_figure(self, figure):
+        self.deletes += 1
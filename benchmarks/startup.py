@@ -0,0 +1,78 @@
+# Start up time of a fresh Python process for each way the library is used, and
+# which of the heavy modules each one ends up loading. Every run is a new process
+# so nothing is already imported. The GUI figures need a display and are skipped
+# without one.
+#
+# Run from the top of the repository with: python benchmarks/startup.py
+import os
+import statistics
+import subprocess
+import sys
+
+TOP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RUNS = 5
+HEAVY = ('tkinter', 'PySimpleGUI', 'networkzero', 'zmq', 'numpy', 'getkey')
+
+MODES = {'import': '''
+import LayoutControlLite
+''',
+         'supervisor': '''
+from LayoutControlLite import Supervisor
+supervisor = Supervisor('Startup')
+''',
+         'headless': '''
+from LayoutControlLite import Track, Turnout, Signal, Layout
+layout = Layout('Startup')
+layout.add(Track('Main', (25, 200), (400, 200)))
+layout.add(Signal('Signal', (400, 225)))
+layout.add(Turnout('Turnout', (500, 200)))
+''',
+         'gui': '''
+from LayoutControlLite import Track, Layout
+import PySimpleGUI as sg
+size = sg.Window.get_screen_size()
+window = sg.Window('Startup', [[sg.Graph(canvas_size = (size[0] - 100, size[1] - 250), graph_bottom_left = (0, 0), graph_top_right = (1200, 300), key = 'panel')]], finalize = True)
+window.close()
+'''}
+
+TIMED = '''
+import sys
+from time import perf_counter
+started = perf_counter()
+{code}
+elapsed = perf_counter() - started
+print(elapsed, ','.join(name for name in {heavy!r} if name in sys.modules))
+'''
+
+def run(code):
+    environment = dict(os.environ)
+    environment['PYTHONPATH'] = TOP + os.pathsep + environment.get('PYTHONPATH', '')
+    output = subprocess.run([sys.executable, '-c', TIMED.format(code = code, heavy = HEAVY)], capture_output = True, text = True, env = environment, stdin = subprocess.DEVNULL)
+    if output.returncode != 0:
+        return None
+    parts = output.stdout.strip().splitlines()[-1].split(' ', 1)
+    return float(parts[0]), parts[1] if len(parts) > 1 else ''
+
+def main():
+    results = []
+    for mode, code in MODES.items():
+        if mode == 'gui' and os.name == 'posix' and not os.environ.get('DISPLAY'):
+            print('%-10s skipped, no display' % mode)
+            continue
+        times = []
+        loaded = ''
+        for ndx in range(RUNS):
+            result = run(code)
+            if result is None:
+                break
+            times.append(result[0])
+            loaded = result[1]
+        if not times:
+            print('%-10s failed' % mode)
+            continue
+        results.append({'mode': mode, 'median_ms': statistics.median(times) * 1000, 'loaded': loaded.split(',') if loaded else []})
+        print('%-10s %8.1f ms  loads %s' % (mode, results[-1]['median_ms'], loaded or 'none of ' + ', '.join(HEAVY)))
+    return results
+
+if __name__ == '__main__':
+    main()
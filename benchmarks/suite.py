@@ -0,0 +1,221 @@
+# Runs every benchmark and writes the results as JSON so that releases can be
+# compared. As well as the separate benchmarks in this directory it measures a
+# Supervisor and a panel talking to each other through the stand-ins, so no
+# hardware or network is needed: command round trips through Supervisor.run,
+# motion ticks, Route.run and the dispatch of panel clicks and item buttons on
+# layouts of increasing size.
+#
+# Run from the top of the repository with: python benchmarks/suite.py [--output results.json] [--only name ...]
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+from datetime import datetime, timezone
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import LayoutControlLite
+supervisor_module = importlib.import_module('LayoutControlLite.Supervisor')
+panel = importlib.import_module('LayoutControlLite.LayoutControlLite')
+from LayoutControlLite.SpatialIndex import SpatialIndex
+import stand_ins
+
+MESSAGES = 2000
+ROUTE_RUNS = 50
+DISPATCHES = 2000
+SIZES = (16, 128, 1024)
+
+def summary(latencies):
+    latencies = sorted(latencies)
+    return {'mean_us': statistics.mean(latencies) * 1e6,
+            'p50_us': latencies[len(latencies) // 2] * 1e6,
+            'p99_us': latencies[int(len(latencies) * 0.99)] * 1e6,
+            'max_us': latencies[-1] * 1e6}
+
+def start_supervisor(network, name, turnouts):
+    # A supervisor with one board for every 16 turnouts running in its own thread
+    boards = [(None, 0x40 + ndx) for ndx in range((turnouts + 15) // 16)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        supervisor = supervisor_module.Supervisor(name, boards = boards)
+        for ndx in range(turnouts):
+            supervisor.add_turnout(supervisor_module.Turnout('Turnout ' + str(ndx), (ndx // 16, ndx % 16), move_speed = 10000))
+    thread = threading.Thread(target = supervisor.run, daemon = True)
+    thread.start()
+    return supervisor, thread
+
+def stop_supervisor(network, name, thread):
+    network.send_message_to(network.discover(name), 'shutdown')
+    thread.join()
+    panel._supervisors.pop(name, None)
+    panel._supervisor_records.pop(name, None)
+    panel._supervisor_news.pop(name, None)
+
+def bench_round_trip(network):
+    name = 'bench-round-trip'
+    supervisor, thread = start_supervisor(network, name, 16)
+    results = []
+    for protocol in ('text', 'binary'):
+        if protocol == 'binary':
+            panel._supervisor_register(name, [panel.Turnout('Turnout ' + str(ndx), (0, 0), supervisor = name) for ndx in range(16)])
+        commands = []
+        for ndx in range(16):
+            commands.append('set:turnout:Turnout ' + str(ndx) + (':normal' if ndx % 2 else ':reverse'))
+            commands.append('status:turnout:Turnout ' + str(ndx))
+        latencies = []
+        started = perf_counter()
+        for ndx in range(MESSAGES):
+            sent = perf_counter()
+            panel._supervisor_send(name, commands[ndx % len(commands)])
+            latencies.append(perf_counter() - sent)
+        elapsed = perf_counter() - started
+        result = {'protocol': protocol, 'messages_per_s': MESSAGES / elapsed}
+        result.update(summary(latencies))
+        results.append(result)
+        print('round trip %-6s %10.0f messages/s, mean %7.1f us, p99 %7.1f us' % (protocol, result['messages_per_s'], result['mean_us'], result['p99_us']))
+    stop_supervisor(network, name, thread)
+    return results
+
+def bench_motion_tick(network):
+    # A tick of the motion scheduler with every servo moving, including queueing
+    # the angles for the bus writers
+    results = []
+    for count in SIZES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            supervisor = supervisor_module.Supervisor('bench-motion', boards = [(None, 0x40 + ndx) for ndx in range((count + 15) // 16)])
+            for ndx in range(count):
+                supervisor.add_turnout(supervisor_module.Turnout('Turnout ' + str(ndx), (ndx // 16, ndx % 16), move_speed = 1))
+        latencies = []
+        for turnout in supervisor.turnouts.values():
+            turnout.reverse()
+        for ndx in range(200):
+            started = perf_counter()
+            supervisor.motion.tick()
+            latencies.append(perf_counter() - started)
+        for writer in supervisor.writers.values():
+            writer.stop()
+        result = {'servos': count}
+        result.update(summary(latencies))
+        results.append(result)
+        print('motion tick %5d servos, mean %8.1f us, p99 %8.1f us' % (count, result['mean_us'], result['p99_us']))
+    return results
+
+def synthetic_layout(turnouts, supervisor = None):
+    # A row of turnouts joined by tracks, wrapped onto as many rows as needed, with
+    # two routes that set every turnout one way or the other
+    layout = panel.Layout('Bench ' + str(turnouts), width = 1200, height = 300)
+    normal = panel.Route('Normal')
+    reverse = panel.Route('Reverse')
+    for ndx in range(turnouts):
+        x = 100 + (ndx % 50) * 200
+        y = 100 + (ndx // 50) * 100
+        turnout = panel.Turnout('Turnout ' + str(ndx), (x, y), supervisor = supervisor)
+        layout.add(turnout)
+        layout.add(panel.Track('Track ' + str(ndx), turnout.get_normal_location(), (x + 100, y)))
+        normal.add(turnout, 'normal')
+        reverse.add(turnout, 'reverse')
+    layout.add(normal)
+    layout.add(reverse)
+    return layout
+
+def bench_route_run(network):
+    name = 'bench-route'
+    results = []
+    for count in SIZES:
+        supervisor, thread = start_supervisor(network, name, count)
+        layout = synthetic_layout(count, supervisor = name)
+        routes = [layout.route_index['Normal'], layout.route_index['Reverse']]
+        latencies = []
+        for ndx in range(ROUTE_RUNS):
+            started = perf_counter()
+            routes[ndx % 2].run()
+            latencies.append(perf_counter() - started)
+        stop_supervisor(network, name, thread)
+        result = {'turnouts': count}
+        result.update(summary(latencies))
+        results.append(result)
+        print('route run %5d supervised turnouts, mean %9.1f us, p99 %9.1f us' % (count, result['mean_us'], result['p99_us']))
+    return results
+
+def bench_dispatch(network):
+    # What the window loop does for a click on the panel and for an item button,
+    # find the item and toggle it
+    results = []
+    for count in SIZES:
+        layout = synthetic_layout(count)
+        clickable = SpatialIndex()
+        for block in layout.blocks:
+            block.add_clickable(clickable)
+        turnouts = [layout.index['Turnout ' + str(ndx)] for ndx in range(count)]
+        clicks = []
+        for ndx in range(DISPATCHES):
+            location = turnouts[(ndx * 7919) % count].location
+            sent = perf_counter()
+            item = clickable.find(location)
+            if item:
+                layout._toggle(item)
+            clicks.append(perf_counter() - sent)
+        buttons = []
+        for ndx in range(DISPATCHES):
+            event = '+item+Turnout ' + str((ndx * 7919) % count)
+            sent = perf_counter()
+            item = layout.index.get(event[6:])
+            if isinstance(item, (panel.Turnout, panel.Signal)):
+                layout._toggle(item)
+            buttons.append(perf_counter() - sent)
+        result = {'turnouts': count, 'click': summary(clicks), 'button': summary(buttons)}
+        results.append(result)
+        print('dispatch %5d turnouts, click mean %6.1f us, button mean %6.1f us' % (count, result['click']['mean_us'], result['button']['mean_us']))
+    return results
+
+def separate(module):
+    # One of the other benchmarks in this directory
+    def bench(network):
+        return importlib.import_module(module).main()
+    return bench
+
+BENCHMARKS = {'round_trip': bench_round_trip,
+              'motion_tick': bench_motion_tick,
+              'route_run': bench_route_run,
+              'dispatch': bench_dispatch,
+              'motion_engine': separate('motion_engine'),
+              'motion_profiles': separate('motion_profiles'),
+              'wire_protocol': separate('wire_protocol'),
+              'input_engine': separate('input_engine'),
+              'pca9685_writes': separate('pca9685_writes'),
+              'synthetic_layout': separate('synthetic_layout'),
+              'tracing': separate('tracing'),
+              'startup': separate('startup')}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Run the LayoutControlLite benchmarks')
+    parser.add_argument('--output', default = 'benchmark-results.json', help = 'file to write the JSON results to')
+    parser.add_argument('--only', nargs = '+', choices = list(BENCHMARKS), help = 'run only these benchmarks')
+    arguments = parser.parse_args()
+
+    network = stand_ins.FakeNetwork()
+    stand_ins.install(network, supervisor_module, panel)
+
+    report = {'version': LayoutControlLite.__version__,
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'platform': platform.platform(),
+              'time': datetime.now(timezone.utc).isoformat(),
+              'results': {}}
+    for name in arguments.only or BENCHMARKS:
+        print('==', name)
+        report['results'][name] = BENCHMARKS[name](network)
+    with open(arguments.output, 'w') as output:
+        json.dump(report, output, indent = 2)
+    print('Results written to', arguments.output)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# Builds layouts of any size for scaling tests, and the supervisors to go with
+# them. Each block is a station on its own row: a main line through a ladder of
+# turnouts, the normal side of each turnout running straight on to the entry of
+# the next, a siding stub off the reverse side of each and a signal protecting
+# each turnout. Every block has a route to each siding and one along the main
+# line. The geometry joins up, so Layout.find_path works across a block.
+#
+# main() builds layouts of increasing size and times construction, drawing,
+# lookup, route activation and path finding.
+#
+# Run from the top of the repository with: python benchmarks/synthetic_layout.py
+import contextlib
+import importlib
+import io
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+panel = importlib.import_module('LayoutControlLite.LayoutControlLite')
+import stand_ins
+
+SIZES = ((5, 10), (20, 20), (50, 20), (100, 30)) # (blocks, turnouts per block)
+TURNOUT_SPACING = 200
+ROW_HEIGHT = 150
+CHANNELS = 16
+
+def generate(blocks = 10, turnouts = 10, signals = True, routes = True, supervised = False, items_per_supervisor = 64, interlocking = False):
+    # Returns the layout and, if supervised, the inventory of each supervisor as
+    # {name: [(kind, id, (board, channel))]} ready for make_supervisors
+    layout = panel.Layout('Synthetic %d x %d' % (blocks, turnouts),
+                          width = 200 + (turnouts + 1) * TURNOUT_SPACING,
+                          height = 100 + blocks * ROW_HEIGHT,
+                          interlocking = interlocking)
+    inventories = {}
+    assigned = [0]
+
+    def supervisor_for(kind, id):
+        # Items are shared out among supervisors in order, each one filling its
+        # boards a channel at a time
+        if not supervised:
+            return None
+        ndx = assigned[0]
+        assigned[0] += 1
+        name = 'synthetic-' + str(ndx // items_per_supervisor)
+        slot = ndx % items_per_supervisor
+        inventories.setdefault(name, []).append((kind, id, (slot // CHANNELS, slot % CHANNELS)))
+        return name
+
+    for row in range(blocks):
+        y = 100 + row * ROW_HEIGHT
+        name = 'Block ' + str(row)
+        block = panel.Block(name, name, (100, y + 50))
+        block.add(panel.Track(name + ' Entry', (25, y), (100, y)))
+        items = []
+        for ndx in range(turnouts):
+            x = 200 + ndx * TURNOUT_SPACING
+            id = name + ' Turnout ' + str(ndx)
+            turnout = panel.Turnout(id, (x, y), supervisor = supervisor_for('turnout', id))
+            block.add(turnout)
+            block.add(panel.Stub(name + ' Siding ' + str(ndx), turnout.get_reverse_location(), (x + 180, y - 50)))
+            signal = None
+            if signals:
+                id = name + ' Signal ' + str(ndx)
+                signal = panel.Signal(id, (x - 100, y - 25), supervisor = supervisor_for('signal', id))
+                block.add(signal)
+            items.append((turnout, signal))
+        block.add(panel.Stub(name + ' Exit', (200 + (turnouts - 1) * TURNOUT_SPACING + 100, y), (200 + turnouts * TURNOUT_SPACING, y)))
+        layout.add(block)
+
+        if routes:
+            main = panel.Route(name + ' Main')
+            for turnout, signal in items:
+                main.add(turnout, 'normal')
+                if signal:
+                    main.add(signal, 'clear')
+            layout.add(main)
+            for ndx, (turnout, signal) in enumerate(items):
+                route = panel.Route(name + ' to Siding ' + str(ndx))
+                for before, before_signal in items[:ndx]:
+                    route.add(before, 'normal')
+                    if before_signal:
+                        route.add(before_signal, 'clear')
+                route.add(turnout, 'reverse')
+                if signal:
+                    route.add(signal, 'clear')
+                for after, after_signal in items[ndx + 1:]:
+                    if after_signal:
+                        route.add(after_signal, 'danger')
+                layout.add(route)
+    return layout, inventories
+
+def make_supervisors(inventories, supervisor_module = None):
+    # A Supervisor for each inventory with every item added, the Supervisor module
+    # can be given so that stand-ins installed in it are used
+    if supervisor_module is None:
+        supervisor_module = importlib.import_module('LayoutControlLite.Supervisor')
+    supervisors = {}
+    for name, items in inventories.items():
+        boards = max(board for kind, id, (board, channel) in items) + 1
+        supervisor = supervisor_module.Supervisor(name, boards = [(None, 0x40 + board) for board in range(boards)])
+        for kind, id, channel in items:
+            if kind == 'turnout':
+                supervisor.add_turnout(supervisor_module.Turnout(id, channel))
+            else:
+                supervisor.add_signal(supervisor_module.Signal(id, channel))
+        supervisors[name] = supervisor
+    return supervisors
+
+def timed(work):
+    started = perf_counter()
+    result = work()
+    return perf_counter() - started, result
+
+def main():
+    results = []
+    print('%7s %9s %9s %11s %9s %9s %11s %9s' % ('blocks', 'turnouts', 'items', 'construct', 'draw', 'lookup', 'route run', 'path'))
+    for blocks, turnouts in SIZES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            construct, (layout, inventories) = timed(lambda: generate(blocks, turnouts))
+        graph = stand_ins.FakeGraph()
+        def draw():
+            for block in layout.blocks:
+                block.set_panel(graph)
+            layout.draw()
+        draw_time, unused = timed(draw)
+        ids = list(layout.index)
+        lookup, unused = timed(lambda: [layout.find_element(id) for id in ids])
+        routes = layout.routes
+        route_run, unused = timed(lambda: [route.run() for route in routes])
+        last = 'Block %d' % (blocks - 1)
+        first_path, unused = timed(lambda: layout.find_path(last + ' Entry', last + ' Siding ' + str(turnouts - 1)))
+        result = {'blocks': blocks,
+                  'turnouts': blocks * turnouts,
+                  'items': len(ids),
+                  'routes': len(routes),
+                  'construct_s': construct,
+                  'draw_s': draw_time,
+                  'figures': graph.draws,
+                  'lookup_us': lookup / len(ids) * 1e6,
+                  'route_run_us': route_run / len(routes) * 1e6,
+                  'first_path_s': first_path}
+        results.append(result)
+        print('%7d %9d %9d %10.1fms %8.1fms %8.2fus %10.1fus %8.1fms' %
+              (blocks, blocks * turnouts, len(ids), construct * 1e3, draw_time * 1e3, result['lookup_us'], result['route_run_us'], first_path * 1e3))
+    return results
+
+if __name__ == '__main__':
+    main()
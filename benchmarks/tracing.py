@@ -0,0 +1,87 @@
+# Traces route activations on a panel and a Supervisor talking through the
+# stand-ins and writes the spans of both as Chrome trace events, open them in
+# chrome://tracing or Perfetto. Also times Route.run with and without tracing to
+# show what tracing costs.
+#
+# Run from the top of the repository with: python benchmarks/tracing.py [directory for the trace files]
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+supervisor_module = importlib.import_module('LayoutControlLite.Supervisor')
+panel = importlib.import_module('LayoutControlLite.LayoutControlLite')
+from LayoutControlLite.Tracing import Tracer
+import stand_ins
+
+TURNOUTS = 16
+RUNS = 200
+NAME = 'bench-tracing'
+
+def layout(wait_for_set):
+    normal = panel.Route('Normal')
+    reverse = panel.Route('Reverse')
+    for ndx in range(TURNOUTS):
+        turnout = panel.Turnout('Turnout ' + str(ndx), (100 + ndx * 100, 100), supervisor = NAME, wait_for_set = wait_for_set)
+        normal.add(turnout, 'normal')
+        reverse.add(turnout, 'reverse')
+    return normal, reverse
+
+def timed_runs(routes):
+    started = perf_counter()
+    for ndx in range(RUNS):
+        routes[ndx % 2].run()
+    return (perf_counter() - started) / RUNS
+
+def main(directory = None):
+    if directory is None:
+        directory = tempfile.mkdtemp()
+    network = stand_ins.FakeNetwork()
+    stand_ins.install(network, supervisor_module, panel)
+    with contextlib.redirect_stdout(io.StringIO()):
+        supervisor = supervisor_module.Supervisor(NAME, trace = os.path.join(directory, 'supervisor-trace.json'))
+        for ndx in range(TURNOUTS):
+            supervisor.add_turnout(supervisor_module.Turnout('Turnout ' + str(ndx), ndx, move_speed = 500))
+    thread = threading.Thread(target = supervisor.run, daemon = True)
+    thread.start()
+
+    routes = layout(False)
+    untraced = timed_runs(routes)
+    panel._tracer = Tracer('panel', os.path.join(directory, 'panel-trace.json'))
+    traced = timed_runs(routes)
+
+    # A few runs waiting for the servos so the motion spans are in the trace
+    routes = layout(True)
+    for ndx in range(4):
+        routes[ndx % 2].run()
+    panel_file = panel._tracer.export()
+    spans = len(panel._tracer.events)
+    panel._tracer = None
+
+    network.send_message_to(network.discover(NAME), 'shutdown')
+    thread.join()
+    panel._supervisors.pop(NAME, None)
+    panel._supervisor_news.pop(NAME, None)
+    with open(supervisor.tracer.path) as input:
+        supervisor_spans = [event for event in json.load(input)['traceEvents'] if event['ph'] == 'X']
+    result = {'untraced_us': untraced * 1e6,
+              'traced_us': traced * 1e6,
+              'panel_spans': spans,
+              'supervisor_spans': len(supervisor_spans),
+              'motion_spans': len([event for event in supervisor_spans if event['cat'] == 'motion']),
+              'files': [panel_file, supervisor.tracer.path]}
+    print('route run of %d turnouts, untraced %.1f us, traced %.1f us' % (TURNOUTS, result['untraced_us'], result['traced_us']))
+    print('%d panel spans, %d supervisor spans of which %d are motion, written to %s' %
+          (spans, len(supervisor_spans), result['motion_spans'], ' and '.join(result['files'])))
+    return result
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
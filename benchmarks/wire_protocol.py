@@ -0,0 +1,113 @@
+# Messages per second through the Supervisor for the text protocol and for the
+# compact binary protocol. The messages go through the same JSON serialisation
+# that networkzero uses but not over the network, so the figures show the cost
+# of encoding, parsing and dispatching a command rather than network latency.
+# A batch is every one of the commands, a set and a status of each turnout, in
+# one message.
+#
+# Run from the top of the repository with: python benchmarks/wire_protocol.py
+import json
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import importlib
+supervisor_module = importlib.import_module('LayoutControlLite.Supervisor')
+from LayoutControlLite import WireProtocol
+
+MESSAGES = 20000
+BATCHES = 2000
+REPEATS = 5
+TURNOUTS = 16
+
+def serialise(message):
+    # The same as networkzero does to everything it sends
+    return json.dumps(message).encode('UTF-8')
+
+def unserialise(message):
+    return json.loads(message.decode('UTF-8'))
+
+def make_supervisor():
+    supervisor = supervisor_module.Supervisor('bench')
+    for channel in range(TURNOUTS):
+        supervisor.add_turnout(supervisor_module.Turnout('Turnout ' + str(channel), channel))
+    return supervisor
+
+def text_commands():
+    commands = []
+    for ndx in range(TURNOUTS):
+        commands.append('set:turnout:Turnout ' + str(ndx) + (':normal' if ndx % 2 else ':reverse'))
+        commands.append('status:turnout:Turnout ' + str(ndx))
+    return commands
+
+def bench_text(supervisor, commands):
+    sent = 0
+    started = perf_counter()
+    for ndx in range(MESSAGES):
+        wire = serialise(commands[ndx % len(commands)])
+        sent += len(wire)
+        message = unserialise(wire)
+        reply = serialise(supervisor.locked_command(message.split(':')))
+        unserialise(reply)
+    return MESSAGES / (perf_counter() - started), sent / MESSAGES
+
+def binary_messages(supervisor):
+    messages = {}
+    for ndx in range(TURNOUTS):
+        id = 'Turnout ' + str(ndx)
+        messages.update(WireProtocol.records_for('turnout', id, supervisor.turnouts[id].ndx))
+    return messages
+
+def bench_binary(supervisor, commands):
+    messages = binary_messages(supervisor)
+    sent = 0
+    started = perf_counter()
+    for ndx in range(MESSAGES):
+        wire = serialise(messages[commands[ndx % len(commands)]])
+        sent += len(wire)
+        message = unserialise(wire)
+        reply = serialise(supervisor.binary(message))
+        WireProtocol.decode_reply(unserialise(reply))
+    return MESSAGES / (perf_counter() - started), sent / MESSAGES
+
+def bench_text_batch(supervisor, commands):
+    # Every command for all of the turnouts in one message, as a route sends them
+    sent = 0
+    started = perf_counter()
+    for ndx in range(BATCHES):
+        wire = serialise('batch:' + '|'.join(commands))
+        sent += len(wire)
+        message = unserialise(wire)
+        reply = serialise(supervisor.batch(message[len('batch:'):]))
+        unserialise(reply).split('|')
+    return BATCHES / (perf_counter() - started), sent / BATCHES
+
+def bench_binary_batch(supervisor, commands):
+    messages = binary_messages(supervisor)
+    sent = 0
+    started = perf_counter()
+    for ndx in range(BATCHES):
+        wire = serialise(WireProtocol.join([messages[command] for command in commands]))
+        sent += len(wire)
+        message = unserialise(wire)
+        reply = serialise(supervisor.binary(message))
+        WireProtocol.decode_reply(unserialise(reply))
+    return BATCHES / (perf_counter() - started), sent / BATCHES
+
+def main():
+    supervisor = make_supervisor()
+    commands = text_commands()
+    results = []
+    for name, bench in (('text', bench_text), ('binary', bench_binary),
+                        ('text batch', bench_text_batch), ('binary batch', bench_binary_batch)):
+        # The best of a few runs, the others are slowed down by whatever else the
+        # machine is doing
+        rate, size = max(bench(supervisor, commands) for repeat in range(REPEATS))
+        results.append({'protocol': name, 'messages_per_s': rate, 'bytes_per_message': size})
+        print('%-12s %10.0f messages/s %7.1f bytes/message' % (name, rate, size))
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 from LayoutControlLite import Track, Stub, Turnout, Signal, Block, Route, Layout
 
-west_entry_track = Track('West Entry', (25, 200), (75, 200))
+west_entry_track = Track('West Entry', (25, 200), (50, 200))
 starter_signal = Signal('Starter', (75, 225))
 west_turnout = Turnout('West Turnout', location = (150, 200))
 
@@ -18,14 +18,10 @@ setuptools.setup(
     keywords="model railway control panel lite",
     url="https://github.com/aajshaw/LayoutControlLite",
     packages=setuptools.find_packages(),
-    install_requires=['pysimplegui', 'get-key', 'networkzero'],
+    python_requires='>=3.9',
+    install_requires=['pysimplegui', 'get-key', 'networkzero', 'numpy'],
     classifiers=(
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.4",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
-        "Programming Language :: Python :: 3.8",
         "Programming Language :: Python :: 3.9",
         "Programming Language :: Python :: 3.10",
         "Programming Language :: Python :: 3.11",
@@ -0,0 +1,52 @@
+import importlib
+import queue
+import threading
+import time
+
+import pytest
+
+panel = importlib.import_module('LayoutControlLite.LayoutControlLite')
+
+class FakeNews:
+    # Stands in for networkzero, news put on the queue is given to the listener.
+    # None leaves the listener waiting for good so that it never gets to the real
+    # networkzero once the test is over
+    def __init__(self):
+        self.news = queue.SimpleQueue()
+
+    def wait_for_news_from(self, address, wait_for_s = None):
+        try:
+            news = self.news.get(timeout = wait_for_s)
+        except queue.Empty:
+            return None, None
+        if news is None:
+            threading.Event().wait()
+        return news
+
+@pytest.fixture
+def listener(monkeypatch):
+    news = FakeNews()
+    monkeypatch.setattr(panel, 'nw0', news)
+    listener = panel._CompletionListener('fake')
+    listener.start()
+    assert listener.ready.wait(5)
+    yield news, listener
+    news.news.put(None)
+    while not news.news.empty():
+        time.sleep(0.01)
+
+def test_news_of_the_expected_position(listener):
+    news, listener = listener
+    arrival = listener.expect('turnout:West', 'reverse')
+    news.news.put(('turnout:West', 'reverse'))
+    assert arrival.wait(5)
+
+def test_news_of_another_position_is_ignored(listener):
+    news, listener = listener
+    arrival = listener.expect('turnout:West', 'reverse')
+    # The end of an earlier move to normal, then of another item
+    news.news.put(('turnout:West', 'normal'))
+    news.news.put(('turnout:East', 'reverse'))
+    assert not arrival.wait(0.2)
+    news.news.put(('turnout:West', 'reverse'))
+    assert arrival.wait(5)
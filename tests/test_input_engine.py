@@ -0,0 +1,76 @@
+from LayoutControlLite.InputEngine import InputEngine
+
+def make_engine():
+    engine = InputEngine(debounce = 0.05, window = 0.15)
+    actions = []
+    return engine, actions, lambda: actions.append('toggle')
+
+def test_bounces_are_dropped():
+    engine, actions, action = make_engine()
+    assert engine.press('button', action, now = 0.0)
+    assert not engine.press('button', action, now = 0.01)
+    assert not engine.press('button', action, now = 0.049)
+    engine.run_due(now = 1.0)
+    assert actions == ['toggle']
+    assert engine.stats()['bounces'] == 2
+
+def test_bounce_is_measured_from_the_last_accepted_press():
+    engine, actions, action = make_engine()
+    engine.press('button', action, now = 0.0)
+    engine.press('button', action, now = 0.04)
+    assert engine.press('button', action, now = 0.06)
+
+def test_even_presses_cancel_out():
+    engine, actions, action = make_engine()
+    engine.press('button', action, now = 0.0)
+    engine.press('button', action, now = 0.1)
+    assert engine.run_due(now = 0.2) == 0
+    assert actions == []
+    assert engine.stats()['cancelled'] == 2
+
+def test_odd_presses_are_one_toggle():
+    engine, actions, action = make_engine()
+    for now in (0.0, 0.06, 0.12):
+        engine.press('button', action, now = now)
+    assert engine.run_due(now = 0.2) == 1
+    assert actions == ['toggle']
+
+def test_presses_that_do_not_toggle_are_one_action():
+    engine, actions, action = make_engine()
+    engine.press('route', action, now = 0.0, toggles = False)
+    engine.press('route', action, now = 0.1, toggles = False)
+    assert engine.run_due(now = 0.2) == 1
+    assert actions == ['toggle']
+
+def test_nothing_is_done_before_the_window_closes():
+    engine, actions, action = make_engine()
+    engine.press('button', action, now = 1.0)
+    assert abs(engine.timeout(now = 1.05) - 0.1) < 1e-9
+    assert engine.run_due(now = 1.1) == 0
+    assert engine.run_due(now = 1.2) == 1
+    assert engine.timeout() is None
+
+def test_keys_fall_due_in_the_order_first_pressed():
+    engine = InputEngine(debounce = 0.05, window = 0.15)
+    order = []
+    engine.press('a', lambda: order.append('a'), now = 0.0)
+    engine.press('b', lambda: order.append('b'), now = 0.1)
+    assert engine.run_due(now = 0.2) == 1
+    assert abs(engine.timeout(now = 0.2) - 0.05) < 1e-9
+    engine.run_due(now = 0.3)
+    assert order == ['a', 'b']
+
+def test_latency_is_from_the_first_press():
+    engine, actions, action = make_engine()
+    engine.press('button', action, now = 10.0)
+    engine.run_due(now = 10.2)
+    stats = engine.stats()
+    assert abs(stats['mean_latency'] - 0.2) < 1e-9
+    assert abs(stats['max_latency'] - 0.2) < 1e-9
+
+def test_debounced_without_coalescing():
+    engine = InputEngine(debounce = 0.05, window = 0.15)
+    assert engine.debounced('button', now = 0.0)
+    assert not engine.debounced('button', now = 0.02)
+    assert engine.debounced('button', now = 0.1)
+    assert engine.pending == {}
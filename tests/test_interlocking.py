@@ -0,0 +1,63 @@
+from LayoutControlLite.Interlocking import Interlocking
+
+class Route:
+    def __init__(self, id):
+        self.id = id
+
+def make_interlocking():
+    # main and loop share the west turnout, goods has only the goods turnout and
+    # puts the starter signal to danger, which main clears
+    interlocking = Interlocking()
+    routes = {'main': Route('main'), 'loop': Route('loop'), 'goods': Route('goods')}
+    interlocking.add(routes['main'], [('west', 'normal'), ('starter', 'clear')])
+    interlocking.add(routes['loop'], [('west', 'reverse'), ('east', 'reverse')])
+    interlocking.add(routes['goods'], [('goods', 'reverse'), ('starter', 'danger')])
+    return interlocking, routes
+
+def test_lock():
+    interlocking, routes = make_interlocking()
+    assert interlocking.lock(routes['main'])
+    assert interlocking.is_locked(routes['main'])
+    assert interlocking.item_locked('west')
+    assert interlocking.item_locked('starter')
+    assert not interlocking.item_locked('east')
+    # Locking again is allowed
+    assert interlocking.lock(routes['main'])
+
+def test_refuse_conflicting_route():
+    interlocking, routes = make_interlocking()
+    interlocking.lock(routes['main'])
+    assert not interlocking.can_lock(routes['loop'])
+    assert not interlocking.lock(routes['loop'])
+    assert not interlocking.is_locked(routes['loop'])
+    assert interlocking.conflicts_with(routes['loop']) == [routes['main']]
+    assert not interlocking.item_locked('east')
+
+def test_danger_is_not_claimed():
+    interlocking, routes = make_interlocking()
+    interlocking.lock(routes['main'])
+    assert interlocking.lock(routes['goods'])
+
+def test_release():
+    interlocking, routes = make_interlocking()
+    interlocking.lock(routes['main'])
+    assert interlocking.release(routes['main'])
+    assert not interlocking.is_locked(routes['main'])
+    assert not interlocking.item_locked('west')
+    assert interlocking.lock(routes['loop'])
+
+def test_release_of_unlocked_route_changes_nothing():
+    interlocking, routes = make_interlocking()
+    interlocking.lock(routes['main'])
+    assert not interlocking.release(routes['loop'])
+    assert interlocking.is_locked(routes['main'])
+    assert interlocking.item_locked('west')
+    assert interlocking.item_locked('starter')
+
+def test_release_all():
+    interlocking, routes = make_interlocking()
+    interlocking.lock(routes['main'])
+    interlocking.lock(routes['goods'])
+    interlocking.release_all()
+    assert not interlocking.item_locked('west')
+    assert interlocking.lock(routes['loop'])
@@ -0,0 +1,107 @@
+from LayoutControlLite.Topology import Topology
+
+class Item:
+    def __init__(self, id):
+        self.id = id
+
+    def __repr__(self):
+        return self.id
+
+def goods_yard():
+    # The tracks of examples/station_goods_yard.py, turnouts are at their default
+    # geometry unless given
+    topology = Topology()
+    items = {}
+
+    def track(id, start, end):
+        items[id] = Item(id)
+        topology.add_track(items[id], start, end)
+
+    def turnout(id, location, entry, normal, reverse):
+        items[id] = Item(id)
+        topology.add_turnout(items[id], location, entry, normal, reverse)
+
+    turnout('West Turnout', (150, 200), (50, 200), (250, 200), (250, 150))
+    turnout('East Turnout', (1050, 200), (1150, 200), (950, 200), (950, 150))
+    turnout('South Turnout', (600, 150), (500, 150), (700, 150), (700, 100))
+    track('West Entry', (25, 200), (50, 200))
+    track('Platform Track', (250, 200), (950, 200))
+    track('South West Track', (250, 150), (500, 150))
+    track('South East Track', (950, 150), (700, 150))
+    track('Goods Shed Track', (700, 100), (1100, 75))
+    return topology, items
+
+def settings(path):
+    return [(item.id, position) for item, position in path]
+
+def test_path_between_tracks():
+    topology, items = goods_yard()
+    assert settings(topology.path(items['West Entry'], items['Goods Shed Track'])) == \
+        [('West Turnout', 'reverse'), ('South Turnout', 'reverse')]
+
+def test_path_reversed():
+    topology, items = goods_yard()
+    forward = topology.path(items['West Entry'], items['Goods Shed Track'])
+    assert topology.path(items['Goods Shed Track'], items['West Entry']) == list(reversed(forward))
+
+def test_path_from_turnout_sets_the_turnout():
+    topology, items = goods_yard()
+    assert settings(topology.path(items['West Turnout'], items['Goods Shed Track'])) == \
+        [('West Turnout', 'reverse'), ('South Turnout', 'reverse')]
+    assert settings(topology.path(items['West Turnout'], items['Platform Track'])) == [('West Turnout', 'normal')]
+
+def test_path_to_turnout_sets_the_turnout():
+    topology, items = goods_yard()
+    assert settings(topology.path(items['Goods Shed Track'], items['West Turnout'])) == \
+        [('South Turnout', 'reverse'), ('West Turnout', 'reverse')]
+    assert settings(topology.path(items['South East Track'], items['South Turnout'])) == [('South Turnout', 'normal')]
+
+def test_path_leaving_turnout_by_its_entry():
+    topology, items = goods_yard()
+    assert topology.path(items['West Turnout'], items['West Entry']) == []
+
+def test_path_between_turnouts():
+    topology, items = goods_yard()
+    assert settings(topology.path(items['West Turnout'], items['South Turnout'])) == [('West Turnout', 'reverse')]
+
+def test_no_path_through_the_points():
+    # The normal and reverse sides of a turnout only meet at its entry
+    topology, items = goods_yard()
+    assert topology.path(items['Platform Track'], items['South West Track']) is None
+    assert settings(topology.path(items['West Entry'], items['South West Track'])) == [('West Turnout', 'reverse')]
+
+def test_unconnected_items():
+    topology, items = goods_yard()
+    siding = Item('Siding')
+    topology.add_track(siding, (2000, 2000), (2100, 2000))
+    assert topology.path(items['Platform Track'], siding) is None
+    assert topology.path(items['Platform Track'], Item('Unknown')) is None
+
+def test_end_part_way_along_a_leg_is_not_joined():
+    # Ends are only joined to ends, a track drawn over the entry leg of a turnout
+    # rather than up to its entry doesn't connect
+    topology, items = goods_yard()
+    overlapping = Item('Overlapping')
+    topology.add_track(overlapping, (25, 250), (75, 200))
+    assert topology.path(overlapping, items['Platform Track']) is None
+
+def test_station_goods_yard_paths():
+    # The example as it is built, every path from the entry of the station
+    from LayoutControlLite import Track, Stub, Turnout, Block, Layout
+    west_entry_track = Track('West Entry', (25, 200), (50, 200))
+    west_turnout = Turnout('West Turnout', location = (150, 200))
+    east_turnout = Turnout('East Turnout', location = (1050, 200), entry = (1150, 200), normal = (950, 200), reverse = (950, 150))
+    platform_track = Track('Platform Track', west_turnout.get_normal_location(), east_turnout.get_normal_location())
+    south_turnout = Turnout('South Turnout', location = (600, 150))
+    south_west_track = Track('South West Track', west_turnout.get_reverse_location(), south_turnout.get_entry_location())
+    south_east_track = Track('South East Track', east_turnout.get_reverse_location(), south_turnout.get_normal_location())
+    goods_terminus = Stub('Goods Shed Track', south_turnout.get_reverse_location(), (1100, 75))
+    block = Block('Station', 'Station', (600, 250))
+    for item in (west_entry_track, west_turnout, east_turnout, platform_track, south_turnout, south_west_track, south_east_track, goods_terminus):
+        block.add(item)
+    layout = Layout('Shaws Halt')
+    layout.add(block)
+    assert settings(layout.find_path('West Entry', 'Platform Track')) == [('West Turnout', 'normal')]
+    assert settings(layout.find_path('West Entry', 'Goods Shed Track')) == [('West Turnout', 'reverse'), ('South Turnout', 'reverse')]
+    assert settings(layout.find_path('West Entry', 'South East Track')) == [('West Turnout', 'reverse'), ('South Turnout', 'normal')]
+    assert settings(layout.find_path('West Turnout', 'Goods Shed Track')) == [('West Turnout', 'reverse'), ('South Turnout', 'reverse')]
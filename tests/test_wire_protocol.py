@@ -0,0 +1,49 @@
+import base64
+
+import pytest
+
+from LayoutControlLite import WireProtocol
+
+def test_encode_decode_round_trip():
+    records = [(WireProtocol.OP_NORMAL, 0), (WireProtocol.OP_STATUS, 7), (WireProtocol.OP_DANGER, 65535)]
+    message = WireProtocol.encode([WireProtocol.COMMAND.pack(*record) for record in records])
+    assert message.startswith(WireProtocol.MARK)
+    assert list(WireProtocol.decode(message)) == records
+
+def test_decode_single_record_twice():
+    message = WireProtocol.encode([WireProtocol.COMMAND.pack(WireProtocol.OP_REVERSE, 3)])
+    assert WireProtocol.decode(message) == ((WireProtocol.OP_REVERSE, 3),)
+    assert WireProtocol.decode(message) == ((WireProtocol.OP_REVERSE, 3),)
+
+def test_decode_rejects_bad_messages():
+    with pytest.raises(ValueError):
+        WireProtocol.decode(WireProtocol.MARK + 'not base64!')
+    with pytest.raises(ValueError):
+        WireProtocol.decode(WireProtocol.MARK + base64.b64encode(b'\x01\x00').decode('ascii'))
+
+def test_records_for_gives_messages():
+    messages = WireProtocol.records_for('turnout', 'West', 5)
+    assert set(messages) == {'set:turnout:West:normal', 'set:turnout:West:reverse', 'status:turnout:West'}
+    assert WireProtocol.decode(messages['set:turnout:West:reverse']) == ((WireProtocol.OP_REVERSE, 5),)
+    messages = WireProtocol.records_for('signal', 'Home', 9)
+    assert WireProtocol.decode(messages['set:signal:Home:clear']) == ((WireProtocol.OP_CLEAR, 9),)
+
+def test_join():
+    turnout = WireProtocol.records_for('turnout', 'West', 5)
+    signal = WireProtocol.records_for('signal', 'Home', 300)
+    message = WireProtocol.join([turnout['status:turnout:West'], signal['set:signal:Home:danger'], turnout['set:turnout:West:normal']])
+    assert list(WireProtocol.decode(message)) == [(WireProtocol.OP_STATUS, 5), (WireProtocol.OP_DANGER, 300), (WireProtocol.OP_NORMAL, 5)]
+
+def test_reply_round_trip():
+    replies = [(WireProtocol.REPLY_OK, 0), (WireProtocol.REPLY_ERROR, 0), (WireProtocol.REPLY_SET, 0), (WireProtocol.REPLY_MOVING, 42)]
+    assert WireProtocol.decode_reply(WireProtocol.encode_reply(replies)) == ['ok', 'error', 'set', 'moving:42']
+    for reply, status in zip(replies, ['ok', 'error', 'set', 'moving:42']):
+        assert WireProtocol.decode_reply(WireProtocol.encode_reply([reply])) == [status]
+
+def test_single_reply_matches_packed_record():
+    message = WireProtocol.encode_reply([(WireProtocol.REPLY_MOVING, 100)])
+    assert message == WireProtocol.MARK + base64.b64encode(WireProtocol.REPLY.pack(WireProtocol.REPLY_MOVING, 100)).decode('ascii')
+
+def test_unknown_reply_status_is_error():
+    message = WireProtocol.MARK + base64.b64encode(WireProtocol.REPLY.pack(200, 0) + WireProtocol.REPLY.pack(WireProtocol.REPLY_SET, 0)).decode('ascii')
+    assert WireProtocol.decode_reply(message) == ['error', 'set']